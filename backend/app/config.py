@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings
 from .services.settings import SettingsManager
 
@@ -23,6 +24,54 @@ class Settings(BaseSettings):
     max_upload_size: int = 100 * 1024 * 1024  # 100MB
     allowed_extensions: set = {".jpg", ".jpeg", ".png", ".gif", ".webm", ".webp", ".mp4"}
 
+    # Database settings
+    database_url: Optional[str] = None  # SQLAlchemy URL; defaults to SQLite in the data directory
+    db_pool_size: int = 10  # PostgreSQL writer pool size
+    db_max_overflow: int = 10  # Extra PostgreSQL connections allowed under load
+    db_read_pool_size: int = 4  # Connections in the read pool
+    write_batch_window_ms: float = 2.0  # How long the writer waits to group queued writes
+    write_batch_max: int = 64  # Max write units sharing one commit
+
+    query_stats_enabled: bool = True  # Time every statement and aggregate per route
+    slow_query_ms: float = 250  # Log statements slower than this with their query plan; 0 disables
+
+    # SQLite pragmas, applied to every connection
+    db_journal_mode: str = "WAL"  # WAL lets readers run while a write is in progress
+    db_synchronous: str = "NORMAL"  # NORMAL is durable across app crashes in WAL mode
+    db_cache_size: int = -64000  # Page cache per connection; negative values are KiB
+    db_mmap_size: int = 256 * 1024 * 1024  # Bytes of the database file to memory-map
+    db_temp_store: str = "MEMORY"  # Where temp tables and sort spills live
+    db_busy_timeout: int = 5000  # Milliseconds to wait on a locked database
+    db_journal_size_limit: int = 64 * 1024 * 1024  # Bytes the WAL file is truncated to after a checkpoint
+
+    # Background maintenance (SQLite only)
+    maintenance_enabled: bool = True
+    maintenance_interval_minutes: float = 60  # Minimum time between maintenance passes
+    maintenance_idle_seconds: float = 30  # Quiet period (no writes) required before a pass
+    maintenance_window: str = ""  # Local time range to run in, e.g. "02:00-06:00"; empty for any time
+    maintenance_analysis_limit: int = 1000  # Rows ANALYZE samples per index; 0 reads everything
+    maintenance_vacuum_pages: int = 1000  # Free pages released per incremental vacuum step
+    maintenance_vacuum_threshold: float = 0.25  # Free page share that triggers a one-off full VACUUM on older databases
+
+    # Backup settings
+    backup_dir: Optional[Path] = None  # Defaults to <data dir>/backups
+    backup_retention: int = 7  # Completed backups to keep; older ones are deleted
+    backup_pages_per_step: int = 1024  # Database pages copied per backup step
+    backup_step_sleep_ms: float = 5  # Pause between steps so writers get the database
+    backup_max_restarts: int = 3  # Restarts caused by concurrent writes before copying in one step
+
+    # Search settings
+    tag_index_enabled: bool = True  # In-memory tag bitmap index (requires pyroaring)
+    tag_index_inline_limit: int = 100000  # Max candidate ids handed to SQL for hydration
+    plan_cache_size: int = 512  # Compiled query plans, keyed by normalized query
+    count_cache_size: int = 1024  # Cached result counts, keyed by normalized query
+    facet_cache_size: int = 256  # Cached facet summaries, keyed by normalized query
+    random_candidate_cache_size: int = 16  # Cached matching id sets for sort=random
+    tag_meta_cache_size: int = 20000  # Cached tag categories and counts for include=tagMeta
+    count_estimate_sample: int = 5000  # Post ids sampled uniformly for count=estimate
+    wildcard_expansion_limit: int = 200  # Max tags a `*` wildcard term expands to
+    tag_job_chunk_size: int = 500  # Posts per transaction when applying implications and aliases retroactively
+
     # Server settings
     host: str = "0.0.0.0"
     port: int = 8000
@@ -59,6 +108,13 @@ class Settings(BaseSettings):
         """Get uploads directory."""
         return self.data_dir / "uploads"
 
+    @property
+    def backups_dir(self) -> Path:
+        """Get backups directory."""
+        if self.backup_dir:
+            return Path(self.backup_dir).resolve()
+        return self.data_dir / "backups"
+
 
 settings = Settings()
 
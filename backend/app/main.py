@@ -8,6 +8,13 @@ from fastapi.responses import FileResponse
 
 from .config import settings
 from .database import init_db
+from .services.maintenance import maintenance_scheduler
+from .services.query_log import QueryTimingMiddleware
+from .services.tag_graph import tag_graph
+from .services.tag_index import tag_index
+from .services.tag_jobs import tag_jobs
+from .services.tag_names import tag_name_index
+from .services.writer import write_coordinator
 from .routers import uploads, posts, tags, pools, notes, comments, settings as settings_router
 
 # Configure logging
@@ -24,7 +31,17 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
     # Initialize database
     await init_db()
+    # Build in-memory search indexes
+    await tag_index.build()
+    await tag_graph.load()
+    await tag_name_index.build()
+    write_coordinator.start()
+    tag_jobs.start()
+    maintenance_scheduler.start()
     yield
+    await maintenance_scheduler.stop()
+    await tag_jobs.stop()
+    await write_coordinator.stop()
 
 
 app = FastAPI(
@@ -42,6 +59,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.query_stats_enabled:
+    app.add_middleware(QueryTimingMiddleware)
 
 # Include routers (must be before static file serving)
 app.include_router(uploads.router)
@@ -72,10 +91,10 @@ async def get_info():
 async def get_stats():
     """Get database statistics."""
     from sqlalchemy import select, func
-    from .database import async_session
+    from .database import read_session
     from .models import Post, Tag, Pool
 
-    async with async_session() as session:
+    async with read_session() as session:
         post_count = await session.execute(select(func.count(Post.id)))
         tag_count = await session.execute(select(func.count(Tag.id)))
         pool_count = await session.execute(select(func.count(Pool.id)))
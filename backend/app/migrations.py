@@ -0,0 +1,113 @@
+"""
+Versioned schema migrations.
+
+New databases are created straight from the models and stamped with the
+latest version. Existing databases run every migration newer than the
+version recorded in schema_migrations, each in its own transaction. When the
+recorded version is current, startup does no DDL at all.
+
+PostgreSQL databases are always created fresh (see migrate_to_postgres.py),
+so the upgrade functions below only ever run against SQLite.
+
+To change the schema, update the models and append a migration that brings
+an existing database to the same state. Never edit or reorder shipped ones.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+
+def add_post_tag_count(conn):
+    """Denormalized tag count on posts, backfilled from post_tags."""
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(posts)")}
+    if "tag_count" not in columns:
+        conn.exec_driver_sql("ALTER TABLE posts ADD COLUMN tag_count INTEGER NOT NULL DEFAULT 0")
+        conn.exec_driver_sql(
+            "UPDATE posts SET tag_count = "
+            "(SELECT count(*) FROM post_tags WHERE post_tags.post_id = posts.id)"
+        )
+
+
+def add_hot_path_indexes(conn):
+    """Indexes for search filters, sorting and the per-post lookups the routers make."""
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_post_tags_tag_id_post_id ON post_tags (tag_id, post_id)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_created_at ON posts (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_extension ON posts (extension)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_file_size ON posts (file_size)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_duration ON posts (duration)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_tag_count ON posts (tag_count)",
+        'CREATE INDEX IF NOT EXISTS ix_pool_posts_pool_id_order ON pool_posts (pool_id, "order", post_id)',
+        "CREATE INDEX IF NOT EXISTS ix_pool_posts_post_id ON pool_posts (post_id)",
+        "CREATE INDEX IF NOT EXISTS ix_notes_post_id ON notes (post_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_post_id_created_at ON comments (post_id, created_at)",
+    ]
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+    # Give the query planner statistics for the new indexes
+    conn.exec_driver_sql("ANALYZE")
+
+
+# (version, description, upgrade function), in order
+MIGRATIONS = [
+    (1, "Add posts.tag_count", add_post_tag_count),
+    (2, "Add hot-path indexes", add_hot_path_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def table_exists(conn, name: str) -> bool:
+    return inspect(conn).has_table(name)
+
+
+def schema_version(conn) -> int:
+    """Highest applied migration, 0 for a database that predates versioning."""
+    if not table_exists(conn, "schema_migrations"):
+        return 0
+    return conn.exec_driver_sql("SELECT max(version) FROM schema_migrations").scalar() or 0
+
+
+def record_version(conn, version: int, description: str):
+    conn.execute(
+        text(
+            "INSERT INTO schema_migrations (version, description, applied_at) "
+            "VALUES (:version, :description, :applied_at)"
+        ),
+        {"version": version, "description": description, "applied_at": datetime.utcnow().isoformat()},
+    )
+
+
+def migrate(conn, metadata):
+    """Bring the database schema up to date. Runs on a sync connection inside init_db."""
+    version = schema_version(conn)
+    if version >= LATEST_VERSION:
+        return
+
+    fresh = not table_exists(conn, "posts")
+    metadata.create_all(conn)
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    )
+    conn.commit()
+
+    if fresh:
+        # create_all already built the latest schema
+        for number, description, _ in MIGRATIONS:
+            record_version(conn, number, description)
+        conn.commit()
+        logger.info(f"Created database schema at version {LATEST_VERSION}")
+        return
+
+    for number, description, upgrade in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"Applying migration {number}: {description}")
+        upgrade(conn)
+        record_version(conn, number, description)
+        conn.commit()
+    logger.info(f"Database schema migrated from version {version} to {LATEST_VERSION}")
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from ..database import Base
@@ -7,6 +7,10 @@ from ..database import Base
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # Covers a post's comments in display order
+        Index("ix_comments_post_id_created_at", "post_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
@@ -9,7 +9,7 @@ class Note(Base):
     __tablename__ = "notes"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False, index=True)
     x = Column(Float, nullable=False)  # X position as percentage (0-100)
     y = Column(Float, nullable=False)  # Y position as percentage (0-100)
     width = Column(Float, nullable=False)  # Width as percentage (0-100)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from ..database import Base
@@ -36,10 +36,14 @@ class Pool(Base):
 
 class PoolPost(Base):
     __tablename__ = "pool_posts"
+    __table_args__ = (
+        # Covers ordered pool listings and pool: searches
+        Index("ix_pool_posts_pool_id_order", "pool_id", "order", "post_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     pool_id = Column(Integer, ForeignKey("pools.id", ondelete="CASCADE"), nullable=False)
-    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False, index=True)
     order = Column(Integer, default=0)
 
     pool = relationship("Pool", back_populates="posts")
@@ -1,8 +1,9 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Index, Table
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 
-from ..database import Base
+from ..database import Base, IS_SQLITE
 
 
 # Junction table for posts and tags
@@ -11,6 +12,8 @@ PostTag = Table(
     Base.metadata,
     Column("post_id", Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
+    # Reverse of the primary key: posts carrying a tag, without touching the table
+    Index("ix_post_tags_tag_id_post_id", "tag_id", "post_id"),
 )
 
 
@@ -20,16 +23,22 @@ class Post(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     sha256 = Column(String(64), unique=True, nullable=False, index=True)
     filename = Column(String(255), nullable=False)
-    extension = Column(String(10), nullable=False)
-    file_size = Column(Integer, nullable=False)
+    extension = Column(String(10), nullable=False, index=True)
+    file_size = Column(Integer, nullable=False, index=True)
     width = Column(Integer)
     height = Column(Integer)
-    duration = Column(Float)  # For videos, in seconds
+    duration = Column(Float, index=True)  # For videos, in seconds
     safety = Column(String(10), default="safe")  # safe, sketchy, unsafe
     source = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    tag_count = Column(Integer, default=0, nullable=False, server_default="0", index=True)  # Denormalized len(tags)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    if not IS_SQLITE:
+        # Denormalized copy of post_tags, searched with @> and && through a GIN index
+        tag_ids = Column(ARRAY(Integer), nullable=False, server_default="{}")
+        __table_args__ = (Index("ix_posts_tag_ids", "tag_ids", postgresql_using="gin"),)
+
     # Relationships
     tags = relationship("Tag", secondary=PostTag, back_populates="posts")
     notes = relationship("Note", back_populates="post", cascade="all, delete-orphan")
@@ -49,21 +58,39 @@ class Post(Base):
         return f"{self.sha256[:2]}/{self.sha256}.jpg"
 
     def to_dict(self):
-        return {
-            "id": self.id,
-            "sha256": self.sha256,
-            "filename": self.filename,
-            "extension": self.extension,
-            "fileSize": self.file_size,
-            "width": self.width,
-            "height": self.height,
-            "duration": self.duration,
-            "safety": self.safety,
-            "source": self.source,
-            "createdAt": self.created_at.isoformat() if self.created_at else None,
-            "updatedAt": self.updated_at.isoformat() if self.updated_at else None,
-            "tags": [tag.name for tag in self.tags] if self.tags else [],
-            "isFavorited": self.favorite is not None,
-            "contentUrl": f"/api/media/posts/{self.content_path}",
-            "thumbUrl": f"/api/media/thumbs/{self.thumb_path}",
-        }
+        tags = [tag.name for tag in self.tags] if self.tags else []
+        return post_to_dict(self, tags, self.favorite is not None)
+
+
+# Keys of post_to_dict(), selectable with the `fields` parameter
+POST_FIELDS = (
+    "id", "sha256", "filename", "extension", "fileSize", "width", "height", "duration",
+    "safety", "source", "createdAt", "updatedAt", "tags", "isFavorited", "contentUrl", "thumbUrl",
+)
+
+
+def post_to_dict(post, tags: list[str], is_favorited: bool) -> dict:
+    """
+    API representation of a post. `post` is a Post or any row with the posts
+    columns, so list endpoints can serialize Core rows without ORM objects.
+    """
+    sha256 = post.sha256
+    return {
+        "id": post.id,
+        "sha256": sha256,
+        "filename": post.filename,
+        "extension": post.extension,
+        "fileSize": post.file_size,
+        "width": post.width,
+        "height": post.height,
+        "duration": post.duration,
+        "safety": post.safety,
+        "source": post.source,
+        "createdAt": post.created_at.isoformat() if post.created_at else None,
+        "updatedAt": post.updated_at.isoformat() if post.updated_at else None,
+        "tags": tags,
+        "isFavorited": bool(is_favorited),
+        # extension already includes the dot (e.g., ".jpg")
+        "contentUrl": f"/api/media/posts/{sha256[:2]}/{sha256}{post.extension}",
+        "thumbUrl": f"/api/media/thumbs/{sha256[:2]}/{sha256}.jpg",
+    }
@@ -0,0 +1,58 @@
+"""Response classes and conditional GET helpers."""
+import time
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+from .services.cache import library_generation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The write generation restarts at 0 with the process; this keeps ETags
+# from before a restart from matching ones issued after it
+BOOT_ID = format(time.time_ns(), "x")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson when it is installed. Return it
+    directly from a route with plain dicts, lists, strings and numbers to
+    also skip FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+
+def weak_etag(*parts) -> str:
+    """
+    Weak ETag for a response built from library data. Any committed write
+    changes it; `parts` (e.g. a row's updated_at) narrow it to one resource.
+    """
+    values = [BOOT_ID, library_generation.value]
+    for part in parts:
+        values.append(part.strftime("%Y%m%d%H%M%S%f") if hasattr(part, "strftime") else part)
+    return 'W/"' + "-".join(str(value) for value in values) + '"'
+
+
+def cache_headers(etag: str) -> dict:
+    # no-cache: clients may store the response but must revalidate it each time
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response when the request's If-None-Match already has `etag`, else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    # Weak comparison: W/ prefixes are ignored
+    tags = {value.strip().removeprefix("W/") for value in header.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
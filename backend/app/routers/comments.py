@@ -4,8 +4,10 @@ from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..database import get_read_db
 from ..models import Comment, Post
+from ..services.fulltext import fulltext_index
+from ..services.writer import write_coordinator
 
 router = APIRouter(prefix="/api", tags=["comments"])
 
@@ -19,7 +21,7 @@ class UpdateCommentRequest(BaseModel):
 
 
 @router.get("/posts/{post_id}/comments")
-async def list_comments(post_id: int, db: AsyncSession = Depends(get_db)):
+async def list_comments(post_id: int, db: AsyncSession = Depends(get_read_db)):
     """List all comments on a post."""
     # Verify post exists
     post_result = await db.execute(select(Post).where(Post.id == post_id))
@@ -34,51 +36,62 @@ async def list_comments(post_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.post("/posts/{post_id}/comments")
-async def create_comment(post_id: int, request: CreateCommentRequest, db: AsyncSession = Depends(get_db)):
+async def create_comment(post_id: int, request: CreateCommentRequest):
     """Create a comment on a post."""
-    # Verify post exists
-    post_result = await db.execute(select(Post).where(Post.id == post_id))
-    if not post_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Post not found")
+    async def write(db: AsyncSession):
+        # Verify post exists
+        post_result = await db.execute(select(Post.id).where(Post.id == post_id))
+        if post_result.first() is None:
+            raise HTTPException(status_code=404, detail="Post not found")
 
-    if not request.text.strip():
-        raise HTTPException(status_code=400, detail="Comment text cannot be empty")
+        if not request.text.strip():
+            raise HTTPException(status_code=400, detail="Comment text cannot be empty")
 
-    comment = Comment(post_id=post_id, text=request.text.strip())
-    db.add(comment)
-    await db.commit()
-    await db.refresh(comment)
-    return comment.to_dict()
+        comment = Comment(post_id=post_id, text=request.text.strip())
+        db.add(comment)
+        await db.flush()
+        await fulltext_index.index_post(db, post_id)
+        await db.refresh(comment)
+        return comment.to_dict()
+
+    return await write_coordinator.submit(write)
 
 
 @router.put("/comments/{comment_id}")
-async def update_comment(comment_id: int, request: UpdateCommentRequest, db: AsyncSession = Depends(get_db)):
+async def update_comment(comment_id: int, request: UpdateCommentRequest):
     """Update a comment."""
-    result = await db.execute(select(Comment).where(Comment.id == comment_id))
-    comment = result.scalars().first()
+    async def write(db: AsyncSession):
+        result = await db.execute(select(Comment).where(Comment.id == comment_id))
+        comment = result.scalars().first()
 
-    if not comment:
-        raise HTTPException(status_code=404, detail="Comment not found")
+        if not comment:
+            raise HTTPException(status_code=404, detail="Comment not found")
 
-    if request.text is not None:
-        if not request.text.strip():
-            raise HTTPException(status_code=400, detail="Comment text cannot be empty")
-        comment.text = request.text.strip()
+        if request.text is not None:
+            if not request.text.strip():
+                raise HTTPException(status_code=400, detail="Comment text cannot be empty")
+            comment.text = request.text.strip()
+            await fulltext_index.index_post(db, comment.post_id)
 
-    await db.commit()
-    await db.refresh(comment)
-    return comment.to_dict()
+        await db.flush()
+        await db.refresh(comment)
+        return comment.to_dict()
+
+    return await write_coordinator.submit(write)
 
 
 @router.delete("/comments/{comment_id}")
-async def delete_comment(comment_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_comment(comment_id: int):
     """Delete a comment."""
-    result = await db.execute(select(Comment).where(Comment.id == comment_id))
-    comment = result.scalars().first()
+    async def write(db: AsyncSession):
+        result = await db.execute(select(Comment).where(Comment.id == comment_id))
+        comment = result.scalars().first()
+
+        if not comment:
+            raise HTTPException(status_code=404, detail="Comment not found")
 
-    if not comment:
-        raise HTTPException(status_code=404, detail="Comment not found")
+        await db.delete(comment)
+        await fulltext_index.index_post(db, comment.post_id)
+        return {"success": True}
 
-    await db.delete(comment)
-    await db.commit()
-    return {"success": True}
+    return await write_coordinator.submit(write)
@@ -4,8 +4,10 @@ from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..database import get_read_db
 from ..models import Note, Post
+from ..services.fulltext import fulltext_index
+from ..services.writer import write_coordinator
 
 router = APIRouter(prefix="/api", tags=["notes"])
 
@@ -27,7 +29,7 @@ class UpdateNoteRequest(BaseModel):
 
 
 @router.get("/posts/{post_id}/notes")
-async def list_notes(post_id: int, db: AsyncSession = Depends(get_db)):
+async def list_notes(post_id: int, db: AsyncSession = Depends(get_read_db)):
     """List all notes on a post."""
     # Verify post exists
     post_result = await db.execute(select(Post).where(Post.id == post_id))
@@ -40,79 +42,90 @@ async def list_notes(post_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.post("/posts/{post_id}/notes")
-async def create_note(post_id: int, request: CreateNoteRequest, db: AsyncSession = Depends(get_db)):
+async def create_note(post_id: int, request: CreateNoteRequest):
     """Create a note on a post."""
-    # Verify post exists
-    post_result = await db.execute(select(Post).where(Post.id == post_id))
-    if not post_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Post not found")
-
-    # Validate bounds
-    if not (0 <= request.x <= 100 and 0 <= request.y <= 100):
-        raise HTTPException(status_code=400, detail="Note position must be between 0 and 100")
-    if not (0 < request.width <= 100 and 0 < request.height <= 100):
-        raise HTTPException(status_code=400, detail="Note size must be between 0 and 100")
-
-    note = Note(
-        post_id=post_id,
-        x=request.x,
-        y=request.y,
-        width=request.width,
-        height=request.height,
-        text=request.text,
-    )
-    db.add(note)
-    await db.commit()
-    await db.refresh(note)
-    return note.to_dict()
+    async def write(db: AsyncSession):
+        # Verify post exists
+        post_result = await db.execute(select(Post.id).where(Post.id == post_id))
+        if post_result.first() is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        # Validate bounds
+        if not (0 <= request.x <= 100 and 0 <= request.y <= 100):
+            raise HTTPException(status_code=400, detail="Note position must be between 0 and 100")
+        if not (0 < request.width <= 100 and 0 < request.height <= 100):
+            raise HTTPException(status_code=400, detail="Note size must be between 0 and 100")
+
+        note = Note(
+            post_id=post_id,
+            x=request.x,
+            y=request.y,
+            width=request.width,
+            height=request.height,
+            text=request.text,
+        )
+        db.add(note)
+        await db.flush()
+        await fulltext_index.index_post(db, post_id)
+        await db.refresh(note)
+        return note.to_dict()
+
+    return await write_coordinator.submit(write)
 
 
 @router.put("/notes/{note_id}")
-async def update_note(note_id: int, request: UpdateNoteRequest, db: AsyncSession = Depends(get_db)):
+async def update_note(note_id: int, request: UpdateNoteRequest):
     """Update a note."""
-    result = await db.execute(select(Note).where(Note.id == note_id))
-    note = result.scalars().first()
+    async def write(db: AsyncSession):
+        result = await db.execute(select(Note).where(Note.id == note_id))
+        note = result.scalars().first()
+
+        if not note:
+            raise HTTPException(status_code=404, detail="Note not found")
 
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
+        if request.x is not None:
+            if not 0 <= request.x <= 100:
+                raise HTTPException(status_code=400, detail="Note x position must be between 0 and 100")
+            note.x = request.x
 
-    if request.x is not None:
-        if not 0 <= request.x <= 100:
-            raise HTTPException(status_code=400, detail="Note x position must be between 0 and 100")
-        note.x = request.x
+        if request.y is not None:
+            if not 0 <= request.y <= 100:
+                raise HTTPException(status_code=400, detail="Note y position must be between 0 and 100")
+            note.y = request.y
 
-    if request.y is not None:
-        if not 0 <= request.y <= 100:
-            raise HTTPException(status_code=400, detail="Note y position must be between 0 and 100")
-        note.y = request.y
+        if request.width is not None:
+            if not 0 < request.width <= 100:
+                raise HTTPException(status_code=400, detail="Note width must be between 0 and 100")
+            note.width = request.width
 
-    if request.width is not None:
-        if not 0 < request.width <= 100:
-            raise HTTPException(status_code=400, detail="Note width must be between 0 and 100")
-        note.width = request.width
+        if request.height is not None:
+            if not 0 < request.height <= 100:
+                raise HTTPException(status_code=400, detail="Note height must be between 0 and 100")
+            note.height = request.height
 
-    if request.height is not None:
-        if not 0 < request.height <= 100:
-            raise HTTPException(status_code=400, detail="Note height must be between 0 and 100")
-        note.height = request.height
+        if request.text is not None:
+            note.text = request.text
+            await fulltext_index.index_post(db, note.post_id)
 
-    if request.text is not None:
-        note.text = request.text
+        await db.flush()
+        await db.refresh(note)
+        return note.to_dict()
 
-    await db.commit()
-    await db.refresh(note)
-    return note.to_dict()
+    return await write_coordinator.submit(write)
 
 
 @router.delete("/notes/{note_id}")
-async def delete_note(note_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_note(note_id: int):
     """Delete a note."""
-    result = await db.execute(select(Note).where(Note.id == note_id))
-    note = result.scalars().first()
+    async def write(db: AsyncSession):
+        result = await db.execute(select(Note).where(Note.id == note_id))
+        note = result.scalars().first()
+
+        if not note:
+            raise HTTPException(status_code=404, detail="Note not found")
 
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
+        await db.delete(note)
+        await fulltext_index.index_post(db, note.post_id)
+        return {"success": True}
 
-    await db.delete(note)
-    await db.commit()
-    return {"success": True}
+    return await write_coordinator.submit(write)
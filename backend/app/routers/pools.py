@@ -1,12 +1,13 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models import Pool, PoolPost, Post
+from ..responses import cache_headers, not_modified, weak_etag
 
 router = APIRouter(prefix="/api/pools", tags=["pools"])
 
@@ -34,7 +35,7 @@ async def list_pools(
     q: str = Query("", description="Search query"),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List pools with search and pagination."""
     stmt = select(Pool).options(selectinload(Pool.posts))
@@ -65,11 +66,28 @@ async def list_pools(
 
 
 @router.get("/{pool_id}")
-async def get_pool(pool_id: int, db: AsyncSession = Depends(get_db)):
+async def get_pool(
+    pool_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+):
     """Get a single pool with its posts."""
+    updated_at = (await db.execute(select(Pool.updated_at).where(Pool.id == pool_id))).first()
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    etag = weak_etag(pool_id, updated_at[0] or 0)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
     result = await db.execute(
         select(Pool)
-        .options(selectinload(Pool.posts).selectinload(PoolPost.post).selectinload(Post.tags))
+        .options(
+            selectinload(Pool.posts).selectinload(PoolPost.post).options(
+                selectinload(Post.tags), selectinload(Post.favorite)
+            )
+        )
         .where(Pool.id == pool_id)
     )
     pool = result.scalars().first()
@@ -81,6 +99,7 @@ async def get_pool(pool_id: int, db: AsyncSession = Depends(get_db)):
     data["posts"] = [
         pp.post.to_dict() for pp in sorted(pool.posts, key=lambda x: x.order) if pp.post
     ]
+    response.headers.update(cache_headers(etag))
     return data
 
 
@@ -1,19 +1,26 @@
 from pathlib import Path
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from sqlalchemy import select, delete, insert
+from sqlalchemy import select, delete, insert, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from ..database import get_db
+from ..database import get_read_db, read_session, upsert
 from ..config import settings
-from ..models import Post, Tag, TagCategory, TagAlias, TagImplication, Favorite
-from ..models.post import PostTag
+from ..responses import FastJSONResponse, cache_headers, not_modified, weak_etag
+from ..models import Post, Tag, TagCategory, TagAlias, Favorite
+from ..models.post import POST_FIELDS, PostTag
 from ..utils.hashing import calculate_sha256
 from ..services.media import get_media_info, create_thumbnail, move_to_storage
-from ..services.search import search_posts
+from ..services.fulltext import fulltext_index
+from ..services.search import search_posts, search_facets, random_post, post_dicts, tag_meta
+from ..services.tag_graph import tag_graph
+from ..services.tag_index import tag_index
+from ..services.tag_jobs import refresh_tag_counts
+from ..services.tag_names import tag_name_index
+from ..services.writer import on_commit, write_coordinator
 from .uploads import get_upload_path, remove_upload_token
 
 router = APIRouter(prefix="/api", tags=["posts"])
@@ -32,8 +39,37 @@ class UpdatePostRequest(BaseModel):
     source: Optional[str] = None
 
 
+# Values accepted by the `include` parameter of post reads
+POST_INCLUDES = {"tagMeta"}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[list[str]]:
+    """Post fields requested as `fields=id,tags,...`, or None for all of them. Always includes id."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in POST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [name for name in dict.fromkeys(names) if name != "id"]
+
+
+def parse_include(include: Optional[str]) -> set[str]:
+    names = {name.strip() for name in (include or "").split(",") if name.strip()}
+    unknown = names - POST_INCLUDES
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+
+def select_fields(data: dict, fields: Optional[list[str]]) -> dict:
+    if fields is None:
+        return data
+    return {name: data[name] for name in fields}
+
+
 @router.post("/posts")
-async def create_post(request: CreatePostRequest, db: AsyncSession = Depends(get_db)):
+async def create_post(request: CreatePostRequest):
     """
     Create a new post from an uploaded file.
     Compatible with szurubooru API.
@@ -48,8 +84,10 @@ async def create_post(request: CreatePostRequest, db: AsyncSession = Depends(get
         sha256 = calculate_sha256(temp_path)
 
         # Check for duplicate
-        existing = await db.execute(select(Post).where(Post.sha256 == sha256))
-        if existing.scalars().first():
+        async with read_session() as session:
+            existing = await session.execute(select(Post.id).where(Post.sha256 == sha256))
+            duplicate = existing.first() is not None
+        if duplicate:
             # Clean up temp file
             temp_path.unlink(missing_ok=True)
             remove_upload_token(request.contentToken)
@@ -73,37 +111,48 @@ async def create_post(request: CreatePostRequest, db: AsyncSession = Depends(get
             logger = logging.getLogger(__name__)
             logger.warning(f"Failed to create thumbnail for {final_path} (extension: {extension})")
 
-        # Create post record
-        post = Post(
-            sha256=sha256,
-            filename=temp_path.name,
-            extension=extension,
-            file_size=file_size,
-            width=media_info.get("width"),
-            height=media_info.get("height"),
-            duration=media_info.get("duration"),
-            safety=request.safety,
-            source=request.source,
-        )
-        db.add(post)
-        await db.flush()  # Get post ID
-
-        # Process tags using direct inserts (avoids lazy loading issues)
-        await process_tags_for_post(db, post.id, request.tags)
+        async def write(db: AsyncSession):
+            # Another upload of the same file may have committed meanwhile
+            existing = await db.execute(select(Post.id).where(Post.sha256 == sha256))
+            if existing.first() is not None:
+                raise HTTPException(status_code=409, detail="Post with this content already exists")
+
+            # Create post record
+            post = Post(
+                sha256=sha256,
+                filename=temp_path.name,
+                extension=extension,
+                file_size=file_size,
+                width=media_info.get("width"),
+                height=media_info.get("height"),
+                duration=media_info.get("duration"),
+                safety=request.safety,
+                source=request.source,
+            )
+            db.add(post)
+            await db.flush()  # Get post ID
+
+            # Process tags using direct inserts (avoids lazy loading issues)
+            post_id = post.id
+            tag_ids = await process_tags_for_post(db, post_id, request.tags)
+            on_commit(db, lambda: tag_index.add_post(post_id, tag_ids))
+            await fulltext_index.index_post(db, post_id)
+
+            # Reload with relationships for response
+            result = await db.execute(
+                select(Post)
+                .options(selectinload(Post.tags), selectinload(Post.favorite))
+                .where(Post.id == post.id)
+                .execution_options(populate_existing=True)
+            )
+            post = result.scalars().first()
+            return post.to_dict()
 
-        await db.commit()
+        response = await write_coordinator.submit(write)
 
         # Clean up token
         remove_upload_token(request.contentToken)
-
-        # Reload with relationships for response
-        result = await db.execute(
-            select(Post)
-            .options(selectinload(Post.tags), selectinload(Post.favorite))
-            .where(Post.id == post.id)
-        )
-        post = result.scalars().first()
-        return post.to_dict()
+        return response
 
     except HTTPException:
         raise
@@ -115,94 +164,179 @@ async def create_post(request: CreatePostRequest, db: AsyncSession = Depends(get
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def process_tags_for_post(db: AsyncSession, post_id: int, tag_names: list[str]):
-    """Process tags for a post using direct SQL inserts to avoid async issues."""
-    if not tag_names:
-        return
+async def process_tags_for_post(db: AsyncSession, post_id: int, tag_names: list[str]) -> set[int]:
+    """
+    Set a post's tags, resolving aliases, creating missing tags and adding
+    implied tags. Works on the whole set at once: a fixed number of
+    statements however many tags the post has. Returns the ids of all tags
+    attached to the post.
+    """
+    names = list(dict.fromkeys(
+        name for name in (tag_name.strip().lower().replace(" ", "_") for tag_name in tag_names) if name
+    ))
 
     resolved_tag_ids = set()
-
-    # Get default category
-    default_cat = await db.execute(select(TagCategory).where(TagCategory.name == "general"))
-    default_category = default_cat.scalars().first()
-    default_cat_id = default_category.id if default_category else 1
-
-    for tag_name in tag_names:
-        tag_name = tag_name.strip().lower().replace(" ", "_")
-        if not tag_name:
-            continue
-
-        # Check for alias
+    if names:
+        # Aliases
         alias_result = await db.execute(
-            select(TagAlias).options(selectinload(TagAlias.target)).where(TagAlias.alias_name == tag_name)
+            select(TagAlias.alias_name, Tag.name)
+            .join(Tag, Tag.id == TagAlias.target_id)
+            .where(TagAlias.alias_name.in_(names))
         )
-        alias = alias_result.scalars().first()
-        if alias and alias.target:
-            tag_name = alias.target.name
+        targets = dict(alias_result.all())
+        names = list(dict.fromkeys(targets.get(name, name) for name in names))
+
+        # Existing tags, then create the rest. ON CONFLICT keeps a concurrent
+        # import creating the same tag from failing this one.
+        tag_result = await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names)))
+        tag_ids = dict(tag_result.all())
+        missing = [name for name in names if name not in tag_ids]
+        if missing:
+            default_cat = await db.execute(select(TagCategory.id).where(TagCategory.name == "general"))
+            default_cat_id = default_cat.scalar() or 1
+            await db.execute(
+                upsert(Tag.__table__)
+                .values([{"name": name, "category_id": default_cat_id} for name in missing])
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            created = await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing)))
+            tag_ids.update(created.all())
 
-        # Get or create tag
-        tag_result = await db.execute(select(Tag).where(Tag.name == tag_name))
-        tag = tag_result.scalars().first()
+            def register_names():
+                for name in missing:
+                    tag_name_index.add(name)
+            on_commit(db, register_names)
 
-        if not tag:
-            tag = Tag(name=tag_name, category_id=default_cat_id)
-            db.add(tag)
-            await db.flush()
+        # Implied tags, followed through chains, from the in-memory closure
+        resolved_tag_ids = tag_graph.expand(tag_ids.values())
 
-        resolved_tag_ids.add(tag.id)
+    # Diff against the current associations
+    current = await db.execute(select(PostTag.c.tag_id).where(PostTag.c.post_id == post_id))
+    current_tag_ids = set(current.scalars().all())
+    added = resolved_tag_ids - current_tag_ids
+    removed = current_tag_ids - resolved_tag_ids
 
-        # Get implications
-        impl_result = await db.execute(
-            select(TagImplication).where(TagImplication.antecedent_id == tag.id)
+    if removed:
+        await db.execute(
+            delete(PostTag).where(PostTag.c.post_id == post_id, PostTag.c.tag_id.in_(removed))
         )
-        for impl in impl_result.scalars().all():
-            resolved_tag_ids.add(impl.consequent_id)
-
-    # Insert all tag associations using direct SQL
-    for tag_id in resolved_tag_ids:
-        # Check if association already exists
-        existing = await db.execute(
-            select(PostTag).where(
-                PostTag.c.post_id == post_id,
-                PostTag.c.tag_id == tag_id
-            )
+    if added:
+        await db.execute(insert(PostTag), [{"post_id": post_id, "tag_id": tag_id} for tag_id in added])
+    if added or removed:
+        # One UPDATE for every usage_count change, never dropping below zero
+        deltas = {tag_id: 1 for tag_id in added} | {tag_id: -1 for tag_id in removed}
+        usage_count = Tag.usage_count + case(deltas, value=Tag.id, else_=0)
+        await db.execute(
+            Tag.__table__.update()
+            .where(Tag.id.in_(deltas))
+            .values(usage_count=case((usage_count < 0, 0), else_=usage_count))
         )
-        if not existing.first():
-            await db.execute(
-                insert(PostTag).values(post_id=post_id, tag_id=tag_id)
-            )
-            # Update usage count
-            await db.execute(
-                Tag.__table__.update().where(Tag.id == tag_id).values(
-                    usage_count=Tag.usage_count + 1
-                )
-            )
 
+    await refresh_tag_counts(db, [post_id])
+    return resolved_tag_ids
 
-@router.get("/posts")
+
+@router.get("/posts", response_class=FastJSONResponse)
 async def list_posts(
+    request: Request,
     q: str = Query("", description="Search query"),
     page: int = Query(1, ge=1),
     limit: int = Query(40, ge=1, le=100),
     sort: str = Query("date"),
     order: str = Query("desc"),
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Keyset cursor from a previous response"),
+    count: str = Query("exact", pattern="^(exact|estimate|none)$"),
+    seed: Optional[int] = Query(None, description="Shuffle seed for sort=random"),
+    fields: Optional[str] = Query(None, description="Comma-separated post fields to return"),
+    include: Optional[str] = Query(None, description="tagMeta: add category and usage of every tag"),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    """List posts with search and pagination."""
-    posts, total = await search_posts(db, q, page, limit, sort, order)
+    """
+    List posts with search and pagination.
+    Pass the returned `next`/`prev` cursor to page by keyset instead of offset.
+    Use count=estimate or count=none to skip exact counting (e.g. infinite scroll).
+    With sort=random, pass back the returned `seed` to keep the shuffle stable across pages.
+    Responses carry an ETag; send it back in If-None-Match to get a 304 until the library changes.
+    `fields` trims each post to the listed fields; include=tagMeta adds a `tagMeta` map of
+    tag name to category, color and usage count, once for the whole page.
+    """
+    fields = parse_fields(fields)
+    include = parse_include(include)
+    # An unseeded shuffle is different on every request
+    etag = None if sort == "random" and seed is None else weak_etag()
+    if etag:
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
 
-    return {
-        "results": [p.to_dict() for p in posts],
+    try:
+        result = await search_posts(db, q, page, limit, sort, order, cursor, count, seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with_tags = fields is None or "tags" in fields or "tagMeta" in include
+    posts = await post_dicts(db, result.posts, with_tags)
+    total = result.total
+    body = {
+        "results": [select_fields(post, fields) for post in posts],
         "total": total,
+        "totalExact": result.total_exact,
         "page": page,
         "limit": limit,
-        "pages": (total + limit - 1) // limit if limit > 0 else 0,
+        "pages": (total + limit - 1) // limit if total is not None else None,
+        "next": result.next_cursor,
+        "prev": result.prev_cursor,
+        "seed": result.seed,
     }
+    if "tagMeta" in include:
+        body["tagMeta"] = await tag_meta(db, (name for post in posts for name in post["tags"]))
+    return FastJSONResponse(body, headers=cache_headers(etag) if etag else None)
+
+
+@router.get("/posts/facets")
+async def get_post_facets(
+    q: str = Query("", description="Search query"),
+    limit: int = Query(25, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Top tags and safety/type distributions across all posts matching a search."""
+    return await search_facets(db, q, limit)
+
+
+@router.get("/posts/random")
+async def get_random_post(
+    q: str = Query("", description="Search query"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Get one random post matching a search."""
+    post = await random_post(db, q)
+    if not post:
+        raise HTTPException(status_code=404, detail="No matching posts")
+    return post.to_dict()
 
 
 @router.get("/posts/{post_id}")
-async def get_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    """Get a single post by ID."""
+async def get_post(
+    post_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated post fields to return"),
+    include: Optional[str] = Query(None, description="tagMeta: add category and usage of every tag"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Get a single post by ID. Takes the same `fields` and `include` parameters as the post list."""
+    fields = parse_fields(fields)
+    include = parse_include(include)
+
+    # Answer revalidations from the post's timestamp before loading anything
+    updated_at = (await db.execute(select(Post.updated_at).where(Post.id == post_id))).first()
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    etag = weak_etag(post_id, updated_at[0] or 0)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
     result = await db.execute(
         select(Post)
         .options(selectinload(Post.tags), selectinload(Post.favorite))
@@ -213,101 +347,121 @@ async def get_post(post_id: int, db: AsyncSession = Depends(get_db)):
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    return post.to_dict()
+    response.headers.update(cache_headers(etag))
+    data = post.to_dict()
+    meta = await tag_meta(db, data["tags"]) if "tagMeta" in include else None
+    data = select_fields(data, fields)
+    if meta is not None:
+        data["tagMeta"] = meta
+    return data
 
 
 @router.put("/posts/{post_id}")
-async def update_post(post_id: int, request: UpdatePostRequest, db: AsyncSession = Depends(get_db)):
-    """Update a post."""
-    result = await db.execute(
-        select(Post).options(selectinload(Post.tags)).where(Post.id == post_id)
-    )
-    post = result.scalars().first()
+async def update_post(
+    post_id: int,
+    request: UpdatePostRequest,
+    include: Optional[str] = Query(None, description="tagMeta: add category and usage of every tag"),
+):
+    """Update a post. include=tagMeta adds the same `tagMeta` map as a post read."""
+    include = parse_include(include)
 
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Post).options(selectinload(Post.tags)).where(Post.id == post_id)
+        )
+        post = result.scalars().first()
 
-    if request.safety is not None:
-        post.safety = request.safety
+        if not post:
+            raise HTTPException(status_code=404, detail="Post not found")
 
-    if request.source is not None:
-        post.source = request.source
+        if request.safety is not None:
+            post.safety = request.safety
 
-    if request.tags is not None:
-        # Decrement old tag counts
-        for tag in post.tags:
-            tag.usage_count = max(0, tag.usage_count - 1)
+        if request.source is not None:
+            post.source = request.source
+            await fulltext_index.index_post(db, post_id)
 
-        # Delete existing tag associations
-        await db.execute(
-            delete(PostTag).where(PostTag.c.post_id == post_id)
+        if request.tags is not None:
+            old_tag_ids = {tag.id for tag in post.tags}
+            new_tag_ids = await process_tags_for_post(db, post_id, request.tags)
+            on_commit(db, lambda: tag_index.set_post_tags(post_id, old_tag_ids, new_tag_ids))
+
+        # Reload for response
+        await db.flush()
+        result = await db.execute(
+            select(Post)
+            .options(selectinload(Post.tags), selectinload(Post.favorite))
+            .where(Post.id == post_id)
+            .execution_options(populate_existing=True)
         )
+        post = result.scalars().first()
+        return post.to_dict()
 
-        # Process new tags
-        await process_tags_for_post(db, post_id, request.tags)
-
-    await db.commit()
-
-    # Reload for response
-    result = await db.execute(
-        select(Post)
-        .options(selectinload(Post.tags), selectinload(Post.favorite))
-        .where(Post.id == post_id)
-    )
-    post = result.scalars().first()
-    return post.to_dict()
+    data = await write_coordinator.submit(write)
+    if "tagMeta" in include:
+        # Read once committed, so tag_meta_cache never holds uncommitted counts
+        async with read_session() as session:
+            data["tagMeta"] = await tag_meta(session, data["tags"])
+    return data
 
 
 @router.delete("/posts/{post_id}")
-async def delete_post(post_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_post(post_id: int):
     """Delete a post and its files."""
-    result = await db.execute(
-        select(Post).options(selectinload(Post.tags)).where(Post.id == post_id)
-    )
-    post = result.scalars().first()
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Post).options(selectinload(Post.tags)).where(Post.id == post_id)
+        )
+        post = result.scalars().first()
 
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+        if not post:
+            raise HTTPException(status_code=404, detail="Post not found")
 
-    # Delete files
-    content_path = settings.posts_dir / post.sha256[:2] / f"{post.sha256}{post.extension}"
-    thumb_path = settings.thumbs_dir / post.sha256[:2] / f"{post.sha256}.jpg"
+        # Decrement tag counts
+        tag_ids = [tag.id for tag in post.tags]
+        for tag in post.tags:
+            tag.usage_count = max(0, tag.usage_count - 1)
 
-    content_path.unlink(missing_ok=True)
-    thumb_path.unlink(missing_ok=True)
+        # Delete post
+        await db.delete(post)
+        await fulltext_index.remove_post(db, post_id)
+        on_commit(db, lambda: tag_index.remove_post(post_id, tag_ids))
+        return post.sha256, post.extension
+
+    sha256, extension = await write_coordinator.submit(write)
 
-    # Decrement tag counts
-    for tag in post.tags:
-        tag.usage_count = max(0, tag.usage_count - 1)
+    # Delete files once the row is gone
+    content_path = settings.posts_dir / sha256[:2] / f"{sha256}{extension}"
+    thumb_path = settings.thumbs_dir / sha256[:2] / f"{sha256}.jpg"
 
-    # Delete post
-    await db.delete(post)
-    await db.commit()
+    content_path.unlink(missing_ok=True)
+    thumb_path.unlink(missing_ok=True)
 
     return {"success": True}
 
 
 @router.post("/posts/{post_id}/favorite")
-async def toggle_favorite(post_id: int, db: AsyncSession = Depends(get_db)):
+async def toggle_favorite(post_id: int):
     """Toggle favorite status on a post."""
-    result = await db.execute(
-        select(Post).options(selectinload(Post.favorite)).where(Post.id == post_id)
-    )
-    post = result.scalars().first()
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(Post).options(selectinload(Post.favorite)).where(Post.id == post_id)
+        )
+        post = result.scalars().first()
 
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+        if not post:
+            raise HTTPException(status_code=404, detail="Post not found")
 
-    if post.favorite:
-        await db.delete(post.favorite)
-        is_favorited = False
-    else:
-        fav = Favorite(post_id=post_id)
-        db.add(fav)
-        is_favorited = True
+        if post.favorite:
+            await db.delete(post.favorite)
+            is_favorited = False
+        else:
+            fav = Favorite(post_id=post_id)
+            db.add(fav)
+            is_favorited = True
+        return {"isFavorited": is_favorited}
 
-    await db.commit()
-    return {"isFavorited": is_favorited}
+    return await write_coordinator.submit(write)
 
 
 # Media serving routes
@@ -8,8 +8,11 @@ from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
-from ..database import get_db
+from ..database import IS_SQLITE, get_read_db
 from ..models import Post
+from ..services.backup import backup_service
+from ..services.maintenance import maintenance_scheduler
+from ..services.query_log import query_log
 from ..services.settings import SettingsManager, migrate_data_directory
 
 # Fixed path for cookies file in config directory
@@ -41,6 +44,11 @@ class MigrationResponse(BaseModel):
     directories_copied: Optional[int] = None
 
 
+class BackupRequest(BaseModel):
+    media: bool = True  # Include post files and thumbnails
+    link_media: bool = True  # Hardlink media unchanged since the previous backup
+
+
 class StatsResponse(BaseModel):
     total_files: int
     images: int
@@ -52,6 +60,7 @@ class StatsResponse(BaseModel):
     newest_post: Optional[str] = None
     database_size: int
     database_size_formatted: str
+    maintenance: Optional[dict] = None
 
 
 def format_size(size_bytes: int) -> str:
@@ -158,6 +167,37 @@ async def migrate_data(request: UpdateDataDirRequest):
     return MigrationResponse(**result)
 
 
+@router.post("/backup")
+async def create_backup(request: Optional[BackupRequest] = None):
+    """Start an online backup of the database and media. Poll GET /backup for progress."""
+    request = request or BackupRequest()
+    try:
+        return backup_service.start(media=request.media, link_media=request.link_media)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/backup")
+async def get_backup_status():
+    """Progress of the current or last backup, and the backups on disk."""
+    return backup_service.status()
+
+
+@router.get("/query-stats")
+async def get_query_stats():
+    """Database queries and time per route, and recent slow queries."""
+    return query_log.summary()
+
+
+@router.delete("/query-stats")
+async def reset_query_stats():
+    """Start collecting query stats afresh."""
+    query_log.reset()
+    return {"success": True}
+
+
 @router.post("/ytdlp-cookies")
 async def upload_ytdlp_cookies(file: UploadFile = File(...)):
     """Upload yt-dlp cookies file."""
@@ -223,7 +263,7 @@ async def delete_ytdlp_cookies():
 
 
 @router.get("/stats")
-async def get_stats(db: AsyncSession = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_read_db)):
     """Get server statistics."""
     # Image extensions (without the dot prefix stored in DB)
     image_exts = ['.jpg', '.jpeg', '.png', '.webp']
@@ -269,8 +309,15 @@ async def get_stats(db: AsyncSession = Depends(get_db)):
 
     # Database file size
     db_size = 0
-    if settings.database_path.exists():
+    if not IS_SQLITE:
+        size_result = await db.execute(select(func.pg_database_size(func.current_database())))
+        db_size = size_result.scalar() or 0
+    elif settings.database_path.exists():
         db_size = os.path.getsize(settings.database_path)
+    # Pages not yet checkpointed back into the main file (WAL mode)
+    wal_path = settings.database_path.with_name(settings.database_path.name + "-wal")
+    if IS_SQLITE and wal_path.exists():
+        db_size += os.path.getsize(wal_path)
 
     return StatsResponse(
         total_files=total_files,
@@ -283,4 +330,5 @@ async def get_stats(db: AsyncSession = Depends(get_db)):
         newest_post=newest_post.isoformat() if newest_post else None,
         database_size=db_size,
         database_size_formatted=format_size(db_size),
+        maintenance=maintenance_scheduler.status(),
     )
@@ -1,12 +1,18 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from ..database import get_db
-from ..models import Tag, TagCategory, TagImplication, TagAlias
+from ..database import IS_SQLITE, get_db, get_read_db
+from ..models import Post, PostTag, Tag, TagCategory, TagImplication, TagAlias
+from ..responses import cache_headers, not_modified, weak_etag
+from ..services.cache import library_generation
+from ..services.tag_graph import tag_graph
+from ..services.tag_index import tag_index
+from ..services.tag_jobs import tag_jobs
+from ..services.tag_names import tag_name_index
 
 router = APIRouter(prefix="/api", tags=["tags"])
 
@@ -33,14 +39,22 @@ class CreateAliasRequest(BaseModel):
 
 @router.get("/tags")
 async def list_tags(
+    request: Request,
+    response: Response,
     q: str = Query("", description="Search query"),
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
     sort: str = Query("usage"),  # usage, name, date
     order: str = Query("desc"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List tags with search and pagination."""
+    etag = weak_etag()
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(etag))
+
     stmt = select(Tag).options(selectinload(Tag.category))
 
     # Apply search filter
@@ -85,7 +99,7 @@ async def list_tags(
 async def autocomplete_tags(
     q: str = Query(..., min_length=1),
     limit: int = Query(10, ge=1, le=50),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """Get tag suggestions for autocomplete."""
     stmt = (
@@ -103,7 +117,7 @@ async def autocomplete_tags(
 
 
 @router.get("/tags/{tag_name}")
-async def get_tag(tag_name: str, db: AsyncSession = Depends(get_db)):
+async def get_tag(tag_name: str, db: AsyncSession = Depends(get_read_db)):
     """Get a single tag by name."""
     result = await db.execute(
         select(Tag)
@@ -146,6 +160,8 @@ async def create_tag(request: CreateTagRequest, db: AsyncSession = Depends(get_d
     tag = Tag(name=request.name.lower().replace(" ", "_"), category_id=category.id)
     db.add(tag)
     await db.commit()
+    tag_name_index.add(tag.name)
+    library_generation.bump()  # Wildcard results cached before the name was indexed
     await db.refresh(tag, ["category"])
 
     return tag.to_dict()
@@ -162,6 +178,7 @@ async def update_tag(tag_name: str, request: UpdateTagRequest, db: AsyncSession
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
 
+    old_name = tag.name
     if request.name is not None:
         # Check for conflicts
         new_name = request.name.lower().replace(" ", "_")
@@ -179,6 +196,10 @@ async def update_tag(tag_name: str, request: UpdateTagRequest, db: AsyncSession
         tag.category_id = category.id
 
     await db.commit()
+    if tag.name != old_name:
+        tag_name_index.remove(old_name)
+        tag_name_index.add(tag.name)
+        library_generation.bump()  # Wildcard results cached before the rename was indexed
     await db.refresh(tag, ["category"])
     return tag.to_dict()
 
@@ -192,14 +213,28 @@ async def delete_tag(tag_name: str, db: AsyncSession = Depends(get_db)):
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
 
+    tag_id = tag.id
+    # Posts carrying the tag lose it along with its post_tags rows
+    values = {"tag_count": Post.tag_count - 1}
+    if not IS_SQLITE:
+        values["tag_ids"] = func.array_remove(Post.tag_ids, tag_id)
+    await db.execute(
+        update(Post)
+        .where(Post.id.in_(select(PostTag.c.post_id).where(PostTag.c.tag_id == tag_id)))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
     await db.delete(tag)
     await db.commit()
+    tag_index.remove_tag(tag_id)
+    tag_name_index.remove(tag_name)
+    await tag_graph.load()
     return {"success": True}
 
 
 # Tag Categories
 @router.get("/tag-categories")
-async def list_categories(db: AsyncSession = Depends(get_db)):
+async def list_categories(db: AsyncSession = Depends(get_read_db)):
     """List all tag categories."""
     result = await db.execute(select(TagCategory).order_by(TagCategory.order))
     categories = list(result.scalars().all())
@@ -211,7 +246,7 @@ async def list_categories(db: AsyncSession = Depends(get_db)):
 async def list_implications(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List all tag implications."""
     stmt = (
@@ -253,12 +288,26 @@ async def create_implication(request: CreateImplicationRequest, db: AsyncSession
     if existing.scalars().first():
         raise HTTPException(status_code=409, detail="Implication already exists")
 
+    if antecedent.id == consequent.id:
+        raise HTTPException(status_code=400, detail="A tag cannot imply itself")
+    if tag_graph.would_cycle(antecedent.id, consequent.id):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{consequent.name} already implies {antecedent.name}, this would create a cycle",
+        )
+
     impl = TagImplication(antecedent_id=antecedent.id, consequent_id=consequent.id)
     db.add(impl)
     await db.commit()
+    await tag_graph.load()
     await db.refresh(impl, ["antecedent", "consequent"])
 
-    return impl.to_dict()
+    # Existing posts get the implied tags in the background
+    data = impl.to_dict()
+    data["job"] = tag_jobs.apply_implication(
+        antecedent.id, consequent.id, f"{antecedent.name} -> {consequent.name}"
+    )
+    return data
 
 
 @router.delete("/tag-implications/{impl_id}")
@@ -272,6 +321,7 @@ async def delete_implication(impl_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(impl)
     await db.commit()
+    await tag_graph.load()
     return {"success": True}
 
 
@@ -280,7 +330,7 @@ async def delete_implication(impl_id: int, db: AsyncSession = Depends(get_db)):
 async def list_aliases(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List all tag aliases."""
     stmt = (
@@ -304,23 +354,28 @@ async def create_alias(request: CreateAliasRequest, db: AsyncSession = Depends(g
     if existing.scalars().first():
         raise HTTPException(status_code=409, detail="Alias already exists")
 
-    # Check if alias name is already a real tag
-    existing_tag = await db.execute(select(Tag).where(Tag.name == alias_name))
-    if existing_tag.scalars().first():
-        raise HTTPException(status_code=409, detail="Alias name is already a tag")
-
     # Get target tag
     target_result = await db.execute(select(Tag).where(Tag.name == request.target.lower()))
     target = target_result.scalars().first()
     if not target:
         raise HTTPException(status_code=404, detail=f"Target tag not found: {request.target}")
 
+    # An existing tag with the alias name is merged into the target
+    existing_tag = await db.execute(select(Tag.id).where(Tag.name == alias_name))
+    merged_tag_id = existing_tag.scalar()
+    if merged_tag_id == target.id:
+        raise HTTPException(status_code=400, detail="A tag cannot be an alias of itself")
+
     alias = TagAlias(alias_name=alias_name, target_id=target.id)
     db.add(alias)
     await db.commit()
+    await tag_graph.load()
     await db.refresh(alias, ["target"])
 
-    return alias.to_dict()
+    data = alias.to_dict()
+    if merged_tag_id is not None:
+        data["job"] = tag_jobs.apply_alias(merged_tag_id, target.id, f"{alias_name} -> {target.name}")
+    return data
 
 
 @router.delete("/tag-aliases/{alias_id}")
@@ -334,4 +389,13 @@ async def delete_alias(alias_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(alias)
     await db.commit()
+    await tag_graph.load()
     return {"success": True}
+
+
+# Tag Jobs
+
+@router.get("/tag-jobs")
+async def list_tag_jobs():
+    """Progress of implications and aliases being applied to existing posts."""
+    return tag_jobs.status()
@@ -0,0 +1,254 @@
+"""Online backups of the database and media library."""
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from ..config import settings
+from ..database import IS_SQLITE
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "nekobooru-"
+PARTIAL_SUFFIX = ".partial"
+
+# Linux ioctl that makes a file share another's blocks (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+
+class BackupRestarted(Exception):
+    """Raised from the progress callback to give up on a page-stepped copy."""
+
+
+def copy_database(
+    source: Path,
+    dest: Path,
+    pages: int = -1,
+    sleep: float = 0,
+    max_restarts: int = 0,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    """
+    Copy a live SQLite database with the online backup API.
+
+    With `pages` > 0 the copy runs in steps of that many pages, taking the
+    read lock only for each step. A write from another connection between
+    steps restarts the copy; after `max_restarts` of those it finishes in a
+    single step, which in WAL mode still never blocks readers or writers.
+    `progress(done, total)` is called with page counts after each step.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def on_step(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupRestarted()
+        last_remaining = remaining
+        if progress:
+            progress(total - remaining, total)
+
+    # as_uri() percent-encodes the path, including ?, #, % and Windows drive letters
+    source_conn = sqlite3.connect(Path(source).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        dest_conn = sqlite3.connect(dest)
+        try:
+            try:
+                source_conn.backup(dest_conn, pages=pages, progress=on_step, sleep=sleep)
+            except BackupRestarted:
+                logger.info("Database kept changing during the backup, copying it in one step")
+                source_conn.backup(dest_conn, pages=-1, progress=on_step)
+            # Backups are standalone files, whatever the live journal mode
+            dest_conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dest_conn.close()
+    finally:
+        source_conn.close()
+
+
+def clone_file(source: Path, dest: Path) -> str:
+    """Copy a file, as a reflink where the filesystem supports it. Returns how."""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(source, "rb") as src, open(dest, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, dest)
+            return "reflinked"
+        except OSError:
+            pass  # Not supported here, fall back to a copy
+    shutil.copy2(source, dest)
+    return "copied"
+
+
+def link_or_clone(source: Path, dest: Path, existing: Optional[Path]) -> str:
+    """
+    Hardlink `existing`, the same file in an earlier backup, when there is
+    one; otherwise clone `source`. Returns how the file was written.
+    """
+    if existing is not None and existing.exists() and existing.stat().st_size == source.stat().st_size:
+        try:
+            os.link(existing, dest)
+            return "linked"
+        except OSError:
+            pass  # e.g. a filesystem without hardlinks
+    return clone_file(source, dest)
+
+
+class BackupService:
+    """
+    Writes backups into settings.backups_dir, one directory per backup:
+
+        nekobooru-20240101-120000/
+            nekobooru.db
+            posts/ab/<sha256>.<ext>
+            thumbs/ab/<sha256>.jpg
+
+    Media files are content-addressed and never change, so any file already
+    present in the latest backup with media is hardlinked from it instead of
+    copied.
+    A backup is written under a .partial name and only renamed once complete.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.progress: dict = {"running": False}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def list_backups(self) -> list[Path]:
+        """Completed backups, oldest first."""
+        root = settings.backups_dir
+        if not root.exists():
+            return []
+        return sorted(
+            path for path in root.iterdir()
+            if path.is_dir() and path.name.startswith(BACKUP_PREFIX) and not path.name.endswith(PARTIAL_SUFFIX)
+        )
+
+    def status(self) -> dict:
+        return {
+            **self.progress,
+            "backup_dir": str(settings.backups_dir),
+            "backups": [path.name for path in reversed(self.list_backups())],
+        }
+
+    def start(self, media: bool = True, link_media: bool = True) -> dict:
+        """Start a backup in the background. Poll status() for progress."""
+        if not IS_SQLITE:
+            raise ValueError("Online backups need SQLite; back up PostgreSQL with pg_dump")
+        if self.running:
+            raise RuntimeError("A backup is already running")
+
+        name = base = BACKUP_PREFIX + datetime.now().strftime("%Y%m%d-%H%M%S")
+        counter = 1
+        while (settings.backups_dir / name).exists():
+            counter += 1
+            name = f"{base}-{counter}"
+        self.progress = {
+            "running": True,
+            "name": name,
+            "phase": "database",
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "error": None,
+            "database_pages_done": 0,
+            "database_pages_total": 0,
+            "media_files_done": 0,
+            "media_files_total": 0,
+            "media_linked": 0,
+            "media_reflinked": 0,
+            "media_copied": 0,
+        }
+        self._task = asyncio.create_task(self._run(name, media, link_media))
+        return self.status()
+
+    async def _run(self, name: str, media: bool, link_media: bool):
+        with_media = [path for path in self.list_backups() if (path / settings.posts_dir.name).is_dir()]
+        previous = with_media[-1] if with_media and link_media else None
+        partial = settings.backups_dir / (name + PARTIAL_SUFFIX)
+        try:
+            partial.mkdir(parents=True)
+            await asyncio.to_thread(self._backup_database, partial)
+            if media:
+                self.progress["phase"] = "media"
+                await asyncio.to_thread(self._backup_media, partial, previous)
+            self.progress["phase"] = "rotating"
+            partial.rename(settings.backups_dir / name)
+            await asyncio.to_thread(self._rotate)
+            self.progress["phase"] = "done"
+            logger.info(f"Backup {name} complete")
+        except Exception as e:
+            logger.exception("Backup failed")
+            self.progress["phase"] = "failed"
+            self.progress["error"] = str(e)
+            shutil.rmtree(partial, ignore_errors=True)
+        finally:
+            self.progress["running"] = False
+            self.progress["finished_at"] = datetime.utcnow().isoformat()
+
+    def _backup_database(self, dest_dir: Path):
+        def on_progress(done, total):
+            self.progress["database_pages_done"] = done
+            self.progress["database_pages_total"] = total
+
+        dest = dest_dir / settings.database_path.name
+        copy_database(
+            settings.database_path,
+            dest,
+            pages=settings.backup_pages_per_step,
+            sleep=settings.backup_step_sleep_ms / 1000,
+            max_restarts=settings.backup_max_restarts,
+            progress=on_progress,
+        )
+        check = sqlite3.connect(dest)
+        try:
+            result = check.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            check.close()
+        if result != "ok":
+            raise RuntimeError(f"Backup failed its integrity check: {result}")
+
+    def _backup_media(self, dest_dir: Path, previous: Optional[Path]):
+        sources = [settings.posts_dir, settings.thumbs_dir]
+        files = [
+            (root, path) for root in sources if root.exists()
+            for path in root.rglob("*") if path.is_file()
+        ]
+        self.progress["media_files_total"] = len(files)
+
+        for root, path in files:
+            relative = Path(root.name) / path.relative_to(root)
+            dest = dest_dir / relative
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                how = link_or_clone(path, dest, previous / relative if previous else None)
+                self.progress[f"media_{how}"] += 1
+            except FileNotFoundError:
+                pass  # Post deleted while the backup ran
+            self.progress["media_files_done"] += 1
+
+    def _rotate(self):
+        """
+        Delete the oldest completed backups beyond settings.backup_retention,
+        and partial ones left behind by a crash.
+        """
+        for partial in settings.backups_dir.glob(BACKUP_PREFIX + "*" + PARTIAL_SUFFIX):
+            shutil.rmtree(partial, ignore_errors=True)
+        backups = self.list_backups()
+        keep = max(settings.backup_retention, 1)
+        for old in backups[:-keep]:
+            logger.info(f"Removing old backup {old.name}")
+            shutil.rmtree(old, ignore_errors=True)
+
+
+backup_service = BackupService()
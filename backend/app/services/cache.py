@@ -0,0 +1,52 @@
+"""In-process caches and the library write-generation counter."""
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WriteGeneration:
+    """
+    Counter bumped every time a transaction that wrote library data commits.
+    Cached results stamped with an older generation are stale.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+
+library_generation = WriteGeneration()
+# Bumped when tag names, aliases or implications change, which is all a
+# compiled query plan depends on besides the tag usage counts it orders by
+tag_graph_generation = WriteGeneration()
+# Bumped when a commit writes tags, tag categories or post_tags: tag
+# metadata such as category colors and usage counts
+tag_data_generation = WriteGeneration()
@@ -0,0 +1,131 @@
+"""SQLite FTS5 index over post comments, notes, source and filename."""
+import logging
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, exists, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Comment, Note, Post
+
+logger = logging.getLogger(__name__)
+
+# Mapped on its own metadata so create_all leaves the virtual table to setup()
+post_text = Table(
+    "post_text",
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),  # Post id
+    Column("text", Text),  # Comment and note text
+    Column("source", Text),
+    Column("filename", Text),
+)
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE post_text USING fts5("
+    "text, source, filename, tokenize='unicode61 remove_diacritics 2')"
+)
+
+# One document per post; comments and notes are concatenated into `text`
+DOCUMENT_SQL = """
+INSERT INTO post_text (rowid, text, source, filename)
+SELECT posts.id,
+       coalesce((SELECT group_concat(body, char(10)) FROM (
+           SELECT text AS body FROM comments WHERE comments.post_id = posts.id
+           UNION ALL
+           SELECT text AS body FROM notes WHERE notes.post_id = posts.id
+       )), ''),
+       coalesce(posts.source, ''),
+       coalesce(posts.filename, '')
+FROM posts
+"""
+
+
+def fts_phrase(value: str) -> str:
+    """
+    Quote a search value as an FTS5 phrase so user input can never be parsed
+    as query syntax. A trailing `*` is kept as a prefix match.
+    """
+    value = value.strip()
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    prefix = value.endswith("*")
+    value = value.rstrip("*").replace('"', '""')
+    return f'"{value}"*' if prefix else f'"{value}"'
+
+
+class FullTextIndex:
+    """
+    FTS5 table holding one document per post, keyed by post id.
+
+    The comment, note and post routes refresh a post's document inside the
+    same transaction as the write, so the index commits or rolls back with it.
+    Falls back to LIKE scans on PostgreSQL or when SQLite was built without FTS5.
+    """
+
+    def __init__(self):
+        self.available = False
+
+    def setup(self, conn):
+        """Create the FTS table if needed, filling it when it is new. Runs inside init_db."""
+        if conn.dialect.name != "sqlite":
+            self.available = False
+            return
+
+        exists_row = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_text'"
+        ).first()
+        if exists_row:
+            self.available = True
+            return
+
+        try:
+            conn.exec_driver_sql(CREATE_SQL)
+        except Exception as e:
+            logger.warning(f"FTS5 is not available, text search will scan: {e}")
+            self.available = False
+            return
+
+        conn.exec_driver_sql(DOCUMENT_SQL)
+        self.available = True
+        logger.info("Full-text index created")
+
+    async def index_post(self, session: AsyncSession, post_id: int):
+        """Rebuild the document of one post from its current rows. Call before commit."""
+        if not self.available:
+            return
+        await session.flush()
+        await session.execute(text("DELETE FROM post_text WHERE rowid = :post_id"), {"post_id": post_id})
+        await session.execute(text(DOCUMENT_SQL + " WHERE posts.id = :post_id"), {"post_id": post_id})
+
+    async def remove_post(self, session: AsyncSession, post_id: int):
+        """Drop the document of a deleted post. Call before commit."""
+        if not self.available:
+            return
+        await session.execute(text("DELETE FROM post_text WHERE rowid = :post_id"), {"post_id": post_id})
+
+    async def rebuild(self, session: AsyncSession) -> int:
+        """Regenerate every document. Returns the number of posts indexed."""
+        if not self.available:
+            return 0
+        await session.execute(text("DELETE FROM post_text"))
+        result = await session.execute(text(DOCUMENT_SQL))
+        await session.execute(text("INSERT INTO post_text (post_text) VALUES ('optimize')"))
+        return result.rowcount
+
+    def condition(self, field: str, value: str):
+        """SQL condition matching posts whose `field` (text, source or filename) contains value."""
+        if self.available:
+            return Post.id.in_(
+                select(post_text.c.rowid).where(post_text.c[field].op("MATCH")(fts_phrase(value)))
+            )
+
+        term = value.strip().strip('"').rstrip("*")
+        if field == "source":
+            return Post.source.icontains(term, autoescape=True)
+        if field == "filename":
+            return Post.filename.icontains(term, autoescape=True)
+        return or_(
+            exists().where(Comment.post_id == Post.id, Comment.text.icontains(term, autoescape=True)),
+            exists().where(Note.post_id == Post.id, Note.text.icontains(term, autoescape=True)),
+        )
+
+
+fulltext_index = FullTextIndex()
@@ -0,0 +1,221 @@
+"""Background SQLite maintenance: planner statistics, WAL checkpoints and vacuum."""
+import asyncio
+import logging
+import time
+from datetime import datetime, time as dt_time
+from typing import Awaitable, Callable, Optional
+
+from ..config import settings
+from ..database import IS_SQLITE, engine
+from .cache import library_generation
+from .writer import write_coordinator
+
+logger = logging.getLogger(__name__)
+
+# How often the scheduler checks whether the library is idle
+POLL_SECONDS = 5
+
+
+def parse_window(value: str) -> Optional[tuple[dt_time, dt_time]]:
+    """Parse an "HH:MM-HH:MM" window. Returns None for an empty or invalid value."""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        start, end = (datetime.strptime(part.strip(), "%H:%M").time() for part in value.split("-"))
+    except ValueError:
+        logger.warning(f"Ignoring invalid maintenance window {value!r}, expected HH:MM-HH:MM")
+        return None
+    return start, end
+
+
+def in_window(window: Optional[tuple[dt_time, dt_time]], now: dt_time) -> bool:
+    if window is None:
+        return True
+    start, end = window
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end  # Window wraps past midnight
+
+
+class MaintenanceScheduler:
+    """
+    Runs SQLite housekeeping while the library is idle.
+
+    A pass starts once no write has committed for maintenance_idle_seconds,
+    the local time is inside maintenance_window and maintenance_interval_minutes
+    have passed since the previous pass. Its tasks are:
+
+    - checkpoint: passive WAL checkpoint, which never waits on readers or writers
+    - optimize: PRAGMA optimize, re-analyzing tables whose statistics drifted
+    - analyze: ANALYZE, bounded by maintenance_analysis_limit, after library changes
+    - vacuum: incremental_vacuum in small steps until the free list is empty
+
+    Every statement takes the writer connection only briefly, and the pass
+    stops as soon as a write is queued.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._window = None
+        self._seen_generation = -1
+        self._last_write_at = 0.0
+        self._analyzed_generation: Optional[int] = None
+        self.last_pass: Optional[str] = None
+        self.last_pass_duration_ms: Optional[float] = None
+        self.tasks: dict[str, dict] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the scheduler task on the running event loop."""
+        if self.running or not IS_SQLITE or not settings.maintenance_enabled:
+            return
+        self._window = parse_window(settings.maintenance_window)
+        self._seen_generation = library_generation.value
+        self._last_write_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def status(self) -> dict:
+        """Last run and duration of each task, for the stats endpoint."""
+        return {
+            "enabled": self.running,
+            "window": settings.maintenance_window or None,
+            "last_pass": self.last_pass,
+            "last_pass_duration_ms": self.last_pass_duration_ms,
+            "tasks": self.tasks,
+        }
+
+    def idle(self) -> bool:
+        """True once nothing has been written for maintenance_idle_seconds."""
+        now = time.monotonic()
+        if library_generation.value != self._seen_generation or not write_coordinator.idle:
+            self._seen_generation = library_generation.value
+            self._last_write_at = now
+            return False
+        return now - self._last_write_at >= settings.maintenance_idle_seconds
+
+    async def _run(self):
+        next_pass = 0.0
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            if not self.idle() or time.monotonic() < next_pass:
+                continue
+            if not in_window(self._window, datetime.now().time()):
+                continue
+            try:
+                await self.run_pass()
+            except Exception:
+                logger.exception("Database maintenance failed")
+            next_pass = time.monotonic() + settings.maintenance_interval_minutes * 60
+
+    async def run_pass(self):
+        """Run each maintenance task once, stopping early if a write arrives."""
+        tasks: list[tuple[str, Callable[[], Awaitable[Optional[dict]]]]] = [
+            ("checkpoint", self.checkpoint),
+            ("optimize", self.optimize),
+            ("analyze", self.analyze),
+            ("vacuum", self.vacuum),
+        ]
+        started = time.perf_counter()
+        for name, task in tasks:
+            if not self.idle():
+                logger.info("Database maintenance paused for incoming writes")
+                break
+            task_started = time.perf_counter()
+            detail = await task()
+            if detail is None:
+                continue  # Nothing to do
+            self.tasks[name] = {
+                "last_run": datetime.utcnow().isoformat(),
+                "duration_ms": round((time.perf_counter() - task_started) * 1000, 1),
+                **detail,
+            }
+        self.last_pass = datetime.utcnow().isoformat()
+        self.last_pass_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # Both helpers run on the writer connection outside any transaction, as
+    # checkpoints and VACUUM require, holding it for one statement or script.
+
+    async def _query(self, statement: str) -> list:
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            cursor = await raw.driver_connection.execute(statement)
+            rows = await cursor.fetchall()
+            await cursor.close()
+        return rows
+
+    async def _execute_script(self, script: str):
+        """
+        Run a script to completion. Statements that return no rows are only
+        stepped once by execute(), which for incremental_vacuum frees one page.
+        """
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.executescript(script)
+
+    async def _scalar(self, statement: str) -> int:
+        return (await self._query(statement))[0][0]
+
+    async def checkpoint(self) -> Optional[dict]:
+        _, wal_pages, checkpointed = (await self._query("PRAGMA wal_checkpoint(PASSIVE)"))[0]
+        if wal_pages < 0:
+            return None  # Not in WAL mode
+        return {"wal_pages": wal_pages, "checkpointed_pages": checkpointed}
+
+    async def optimize(self) -> Optional[dict]:
+        await self._execute_script(
+            f"PRAGMA analysis_limit={int(settings.maintenance_analysis_limit)}; PRAGMA optimize;"
+        )
+        return {}
+
+    async def analyze(self) -> Optional[dict]:
+        generation = library_generation.value
+        if generation == self._analyzed_generation:
+            return None
+        await self._execute_script(
+            f"PRAGMA analysis_limit={int(settings.maintenance_analysis_limit)}; ANALYZE;"
+        )
+        self._analyzed_generation = generation
+        return {}
+
+    async def vacuum(self) -> Optional[dict]:
+        free_pages = await self._scalar("PRAGMA freelist_count")
+        if not free_pages:
+            return None
+
+        if await self._scalar("PRAGMA auto_vacuum") != 2:
+            # Created before incremental vacuum was enabled: one full VACUUM
+            # rebuilds the file in incremental mode once enough space is wasted
+            page_count = await self._scalar("PRAGMA page_count")
+            threshold = settings.maintenance_vacuum_threshold
+            if threshold <= 0 or free_pages / page_count < threshold:
+                return None
+            logger.info(f"Running full VACUUM to reclaim {free_pages} free pages")
+            await self._execute_script("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+            return {"mode": "full", "pages_freed": free_pages, "free_pages": 0}
+
+        freed = 0
+        while free_pages and self.idle():
+            await self._execute_script(f"PRAGMA incremental_vacuum({int(settings.maintenance_vacuum_pages)})")
+            remaining = await self._scalar("PRAGMA freelist_count")
+            if remaining >= free_pages:
+                break
+            freed += free_pages - remaining
+            free_pages = remaining
+        return {"mode": "incremental", "pages_freed": freed, "free_pages": free_pages}
+
+
+maintenance_scheduler = MaintenanceScheduler()
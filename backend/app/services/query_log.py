@@ -0,0 +1,192 @@
+"""Per-statement database timing, the slow-query log and per-route query stats."""
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Queries without a request (writer commits, index builds, maintenance)
+BACKGROUND_ROUTE = "(background)"
+
+# Longest statement text kept in the slow-query list
+STATEMENT_PREVIEW = 500
+
+
+@dataclass
+class RequestQueries:
+    """Database work done on behalf of one request."""
+    scope: Optional[dict] = None
+    queries: int = 0
+    db_ms: float = 0.0
+
+    @property
+    def route(self) -> Optional[str]:
+        """Method and path template, once the router has matched the request."""
+        route = self.scope.get("route") if self.scope else None
+        if route is None:
+            return None
+        return f"{self.scope['method']} {route.path}"
+
+
+# Set per request by QueryTimingMiddleware, and by the writer around each unit
+current_request: ContextVar[Optional[RequestQueries]] = ContextVar("current_request", default=None)
+
+
+class QueryLog:
+    """
+    Times every statement through SQLAlchemy cursor events.
+
+    Each statement's latency is added to the request that issued it, and each
+    request's query count, database time and total time are aggregated per
+    route (e.g. "GET /api/posts"), so the gap between the two shows time spent
+    outside the database, such as serialization. Statements slower than
+    settings.slow_query_ms are logged with their query plan and kept in a
+    short list of recent slow queries.
+    """
+
+    def __init__(self):
+        self.routes: dict[str, dict] = {}
+        self.slow_queries: deque = deque(maxlen=50)
+
+    def install(self, engine):
+        """Attach the timing events to a (sync) engine."""
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    # The start time lives on the statement's execution context, so a statement
+    # that raises (and never reaches after_cursor_execute) leaves nothing behind
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        request = current_request.get()
+        if request is not None:
+            request.queries += 1
+            request.db_ms += elapsed_ms
+        else:
+            stats = self._route_stats(BACKGROUND_ROUTE)
+            stats["queries"] += 1
+            stats["db_ms"] += elapsed_ms
+
+        if 0 < settings.slow_query_ms <= elapsed_ms:
+            self._log_slow(conn, cursor, statement, parameters, executemany, elapsed_ms, request)
+
+    def _log_slow(self, conn, cursor, statement, parameters, executemany, elapsed_ms, request):
+        # The async drivers buffer the whole result at execute time
+        rows = cursor.rowcount if cursor.rowcount >= 0 else len(getattr(cursor, "_rows", ()) or ())
+        plan = None if executemany else self._explain(conn, statement, parameters)
+        route = (request.route if request else None) or BACKGROUND_ROUTE
+        self.slow_queries.append({
+            "at": datetime.utcnow().isoformat(),
+            "route": route,
+            "duration_ms": round(elapsed_ms, 1),
+            "rows": rows,
+            "statement": statement[:STATEMENT_PREVIEW],
+            "plan": plan,
+        })
+        logger.warning(
+            f"Slow query ({elapsed_ms:.1f} ms, {rows} rows) in {route}: {' '.join(statement.split())}"
+            + (f"\n  Plan: {plan}" if plan else "")
+        )
+
+    def _explain(self, conn, statement: str, parameters) -> Optional[str]:
+        """Query plan of a slow SELECT, or None if it can't be explained."""
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+        dialect = conn.dialect.name
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+        try:
+            # A raw cursor, so the EXPLAIN itself isn't timed or logged
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(prefix + statement, parameters)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.debug(f"Could not explain slow query: {e}")
+            return None
+        if dialect == "sqlite":
+            return "; ".join(row[-1] for row in rows)  # (id, parent, notused, detail)
+        return "\n".join(row[0] for row in rows)
+
+    def _route_stats(self, route: str) -> dict:
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {
+                "requests": 0, "queries": 0, "db_ms": 0.0, "total_ms": 0.0, "max_ms": 0.0,
+            }
+        return stats
+
+    def record_request(self, request: RequestQueries, total_ms: float):
+        stats = self._route_stats(request.route)
+        stats["requests"] += 1
+        stats["queries"] += request.queries
+        stats["db_ms"] += request.db_ms
+        stats["total_ms"] += total_ms
+        stats["max_ms"] = max(stats["max_ms"], total_ms)
+
+    def summary(self) -> dict:
+        """Per-route totals and averages, slowest database time first."""
+        routes = []
+        for route, stats in self.routes.items():
+            requests = stats["requests"] or 1
+            routes.append({
+                "route": route,
+                "requests": stats["requests"],
+                "queries": stats["queries"],
+                "queries_per_request": round(stats["queries"] / requests, 2),
+                "db_ms": round(stats["db_ms"], 1),
+                "avg_db_ms": round(stats["db_ms"] / requests, 2),
+                "avg_ms": round(stats["total_ms"] / requests, 2),
+                "max_ms": round(stats["max_ms"], 1),
+            })
+        routes.sort(key=lambda item: item["db_ms"], reverse=True)
+        return {
+            "slow_query_ms": settings.slow_query_ms,
+            "routes": routes,
+            "slow_queries": list(reversed(self.slow_queries)),
+        }
+
+    def reset(self):
+        self.routes.clear()
+        self.slow_queries.clear()
+
+
+query_log = QueryLog()
+
+
+class QueryTimingMiddleware:
+    """ASGI middleware that attributes database time to the matched route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestQueries(scope)
+        token = current_request.set(request)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_request.reset(token)
+            if request.route is not None:
+                query_log.record_request(request, (time.perf_counter() - started) * 1000)
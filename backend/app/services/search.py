@@ -1,13 +1,46 @@
+import base64
+import json
+import random
 import re
-from dataclasses import dataclass
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import select, and_, or_, not_, func
+from sqlalchemy import select, and_, or_, not_, exists, func, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from ..models import Post, Tag, PostTag, Favorite, PoolPost
+from ..config import settings
+from ..database import IS_SQLITE
+from ..models import Post, Tag, TagCategory, PostTag, Favorite, PoolPost
+from ..models.post import post_to_dict
+from .cache import LRUCache, library_generation, tag_data_generation, tag_graph_generation
+from .fulltext import fulltext_index
+from .tag_graph import tag_graph
+from .tag_index import BitMap, tag_index
+from .tag_names import tag_name_index
+
+# Canonical query -> (write generation, exact count)
+count_cache = LRUCache(settings.count_cache_size)
+# (canonical query, limit) -> (write generation, facets)
+facet_cache = LRUCache(settings.facet_cache_size)
+# Canonical query -> (write generation, matching ids), for random sort
+candidate_cache = LRUCache(settings.random_candidate_cache_size)
+# Tag name -> (tag data generation, category and usage), for include=tagMeta
+tag_meta_cache = LRUCache(settings.tag_meta_cache_size)
+
+# Media type of each stored extension, for type: filters and facets
+EXTENSION_TYPES = {
+    ".jpg": "image",
+    ".jpeg": "image",
+    ".png": "image",
+    ".webp": "image",
+    ".gif": "gif",
+    ".webm": "video",
+    ".mp4": "video",
+}
 
 
 class TokenType(Enum):
@@ -16,6 +49,9 @@ class TokenType(Enum):
     OR = "or"
     FILTER = "filter"
     NEGATED_FILTER = "negated_filter"
+    NOT = "not"
+    LPAREN = "lparen"
+    RPAREN = "rparen"
 
 
 @dataclass
@@ -27,16 +63,32 @@ class Token:
 
 
 def tokenize(query: str) -> list[Token]:
-    """Tokenize search query into tokens."""
+    """Tokenize search query into tokens. Double quotes keep spaces inside a value."""
     tokens = []
-    parts = query.split()
+    parts = re.findall(r'(?:"[^"]*"?|[^\s"]+)+', query)
 
     i = 0
     while i < len(parts):
         part = parts[i]
 
+        # Leading "(" or "-(" open a (negated) group
+        while part.startswith("(") or part.startswith("-("):
+            if part.startswith("-"):
+                tokens.append(Token(TokenType.NOT, "-"))
+                part = part[1:]
+            tokens.append(Token(TokenType.LPAREN, "("))
+            part = part[1:]
+
+        # Trailing ")" close groups, unless balanced inside a tag like saber_(fate)
+        closing = 0
+        while part.endswith(")") and part.count(")") > part.count("("):
+            part = part[:-1]
+            closing += 1
+
+        if not part:
+            pass
         # Check for OR operator
-        if part.upper() == "OR" and i > 0 and i < len(parts) - 1:
+        elif part.upper() == "OR" and i > 0 and i < len(parts) - 1:
             tokens.append(Token(TokenType.OR, "OR"))
         # Check for negated filter (e.g., -safety:unsafe)
         elif part.startswith("-") and ":" in part[1:]:
@@ -81,11 +133,796 @@ def tokenize(query: str) -> list[Token]:
         else:
             tokens.append(Token(TokenType.TAG, part))
 
+        for _ in range(closing):
+            tokens.append(Token(TokenType.RPAREN, ")"))
         i += 1
 
     return tokens
 
 
+# Query AST. A query parses to an AndNode over tags, filters and nested groups.
+
+@dataclass
+class TagNode:
+    name: str
+    tag_id: Optional[int] = None
+    usage: int = 0
+    implied_by: tuple = ()  # With expand:implied, tags that imply this one also match
+
+    def canonical(self) -> str:
+        return self.name
+
+
+@dataclass
+class FilterNode:
+    key: str
+    op: str
+    value: str
+    condition: object = None
+
+    def canonical(self) -> str:
+        op = "" if self.op == "=" else self.op
+        return f"{self.key}:{op}{self.value}"
+
+
+@dataclass
+class NotNode:
+    child: object
+
+    def canonical(self) -> str:
+        return f"-{wrap_canonical(self.child)}"
+
+
+@dataclass
+class OrNode:
+    children: list
+
+    def canonical(self) -> str:
+        return " OR ".join(sorted(wrap_canonical(c) for c in self.children))
+
+
+@dataclass
+class AndNode:
+    children: list
+
+    def canonical(self) -> str:
+        return " ".join(sorted(wrap_canonical(c) for c in self.children))
+
+
+def wrap_canonical(node) -> str:
+    """Canonical text of a node, parenthesized if it is a group."""
+    text = node.canonical()
+    return f"({text})" if isinstance(node, (AndNode, OrNode)) else text
+
+
+def is_empty(node) -> bool:
+    """An OR of nothing never matches."""
+    return isinstance(node, OrNode) and not node.children
+
+
+def is_always(node) -> bool:
+    """An AND of nothing always matches."""
+    return isinstance(node, AndNode) and not node.children
+
+
+class QueryParser:
+    """
+    Recursive-descent parser from tokens to the query AST.
+
+        query       := sequence
+        sequence    := disjunction*              (implicit AND)
+        disjunction := unary ("OR" unary)*
+        unary       := "-" unary | "(" sequence ")" | term
+
+    OR binds tighter than juxtaposition, so `a b OR c` means a AND (b OR c).
+    Malformed input is tolerated: unmatched parentheses and stray ORs are skipped.
+    """
+
+    def __init__(self, tokens: list[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[Token]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def parse(self) -> AndNode:
+        return AndNode(self.sequence(nested=False))
+
+    def sequence(self, nested: bool) -> list:
+        children = []
+        while (token := self.peek()) is not None:
+            if token.type == TokenType.RPAREN:
+                if nested:
+                    break
+                self.pos += 1  # Unmatched ")"
+                continue
+            node = self.disjunction()
+            if node is not None:
+                children.append(node)
+        return children
+
+    def disjunction(self):
+        first = self.unary()
+        options = [first] if first is not None else []
+        while (token := self.peek()) is not None and token.type == TokenType.OR:
+            self.pos += 1
+            node = self.unary()
+            if node is not None:
+                options.append(node)
+        if not options:
+            return None
+        return options[0] if len(options) == 1 else OrNode(options)
+
+    def unary(self):
+        token = self.peek()
+        if token is None or token.type == TokenType.RPAREN:
+            return None
+        self.pos += 1
+
+        if token.type == TokenType.NOT:
+            child = self.unary()
+            return NotNode(child) if child is not None else None
+        if token.type == TokenType.LPAREN:
+            children = self.sequence(nested=True)
+            if (closing := self.peek()) is not None and closing.type == TokenType.RPAREN:
+                self.pos += 1
+            return AndNode(children)
+        if token.type == TokenType.TAG:
+            return TagNode(token.value)
+        if token.type == TokenType.NEGATED_TAG:
+            return NotNode(TagNode(token.value))
+        if token.type == TokenType.FILTER:
+            return FilterNode(token.filter_key, token.filter_op, token.value)
+        if token.type == TokenType.NEGATED_FILTER:
+            return NotNode(FilterNode(token.filter_key, token.filter_op, token.value))
+        # Stray OR
+        return None
+
+
+def expand_wildcards(node):
+    """Replace `*` wildcard tags with an OR of the (capped) tag names they match."""
+    if isinstance(node, TagNode):
+        if "*" not in node.name:
+            return node
+        names = tag_name_index.expand(node.name, settings.wildcard_expansion_limit)
+        return OrNode([TagNode(name) for name in names])
+    if isinstance(node, NotNode):
+        return NotNode(expand_wildcards(node.child))
+    if isinstance(node, (AndNode, OrNode)):
+        return type(node)([expand_wildcards(c) for c in node.children])
+    return node
+
+
+def collect_tag_names(node, names: Optional[set] = None) -> set[str]:
+    """All tag names referenced anywhere in a query."""
+    names = set() if names is None else names
+    if isinstance(node, TagNode):
+        names.add(node.name)
+    elif isinstance(node, NotNode):
+        collect_tag_names(node.child, names)
+    elif isinstance(node, (AndNode, OrNode)):
+        for child in node.children:
+            collect_tag_names(child, names)
+    return names
+
+
+async def resolve_tags(session: AsyncSession, tag_names: set[str]) -> dict[str, tuple[int, int]]:
+    """
+    Resolve tag names, or aliases of tags, to (id, usage_count) with a single lookup.
+    """
+    if not tag_names:
+        return {}
+    alias_targets = {
+        name: target_id
+        for name in tag_names
+        if (target_id := tag_graph.resolve_alias(name)) is not None
+    }
+    result = await session.execute(
+        select(Tag.name, Tag.id, Tag.usage_count).where(
+            or_(Tag.name.in_(tag_names), Tag.id.in_(set(alias_targets.values())))
+        )
+    )
+
+    resolved = {}
+    by_id = {}
+    for name, tag_id, usage in result:
+        resolved[name] = by_id[tag_id] = (tag_id, usage or 0)
+    for alias_name, target_id in alias_targets.items():
+        if alias_name not in resolved and target_id in by_id:
+            resolved[alias_name] = by_id[target_id]
+    return {name: info for name, info in resolved.items() if name in tag_names}
+
+
+def node_cost(node) -> float:
+    """Estimated number of posts a node matches; negations and filters sort last."""
+    if isinstance(node, TagNode):
+        return node.usage
+    if isinstance(node, OrNode):
+        return sum(node_cost(c) for c in node.children)
+    if isinstance(node, AndNode):
+        return min((node_cost(c) for c in node.children), default=float("inf"))
+    return float("inf")
+
+
+def resolve_node(node, tags: dict[str, tuple[int, int]], expand_implied: bool = False):
+    """
+    Bind tag ids and filter conditions into a node.
+    Unknown tags match nothing; unusable filters match everything.
+    """
+    if isinstance(node, TagNode):
+        if node.name not in tags:
+            return OrNode([])
+        tag_id, usage = tags[node.name]
+        implied_by = tuple(sorted(tag_graph.implied_by(tag_id))) if expand_implied else ()
+        return TagNode(node.name, tag_id, usage, implied_by)
+    if isinstance(node, FilterNode):
+        condition = apply_filter(node)
+        if condition is None:
+            return AndNode([])
+        return FilterNode(node.key, node.op, node.value, condition)
+    if isinstance(node, NotNode):
+        return NotNode(resolve_node(node.child, tags, expand_implied))
+    return type(node)([resolve_node(c, tags, expand_implied) for c in node.children])
+
+
+def optimize(node):
+    """
+    Rewrite a resolved node into a simpler equivalent.
+
+    Folds constants, flattens nested groups of the same kind, removes double
+    negation and duplicate terms, detects `x -x` contradictions and orders
+    conjuncts so the rarest terms are evaluated first.
+    """
+    if isinstance(node, NotNode):
+        child = optimize(node.child)
+        if isinstance(child, NotNode):
+            return child.child
+        if is_empty(child):
+            return AndNode([])
+        if is_always(child):
+            return OrNode([])
+        return NotNode(child)
+
+    if not isinstance(node, (AndNode, OrNode)):
+        return node
+
+    conjunction = isinstance(node, AndNode)
+    children = []
+    seen = set()
+    for child in (optimize(c) for c in node.children):
+        # Flatten (a (b c)) -> (a b c) and (a OR (b OR c)) -> (a OR b OR c)
+        for part in (child.children if type(child) is type(node) else [child]):
+            key = part.canonical()
+            if key not in seen:
+                seen.add(key)
+                children.append(part)
+
+    # Absorbing element: anything AND nothing, anything OR everything
+    absorbing = is_empty if conjunction else is_always
+    if any(absorbing(c) for c in children):
+        return OrNode([]) if conjunction else AndNode([])
+    neutral = is_always if conjunction else is_empty
+    children = [c for c in children if not neutral(c)]
+
+    # x AND -x never matches; x OR -x always does
+    if any(isinstance(c, NotNode) and c.child.canonical() in seen for c in children):
+        return OrNode([]) if conjunction else AndNode([])
+
+    if len(children) == 1:
+        return children[0]
+    if conjunction:
+        children.sort(key=node_cost)
+    return type(node)(children)
+
+
+def is_tag_only(node) -> bool:
+    """Whether a node can be evaluated by the tag index alone."""
+    if isinstance(node, TagNode):
+        return True
+    if isinstance(node, NotNode):
+        return is_tag_only(node.child)
+    if isinstance(node, (AndNode, OrNode)):
+        return all(is_tag_only(c) for c in node.children)
+    return False
+
+
+@dataclass
+class QueryPlan:
+    """A compiled query: tag conjuncts for the index, everything else for SQL."""
+    canonical: str
+    tags: Optional[AndNode] = None
+    filters: list = field(default_factory=list)
+    empty: bool = False
+
+
+# Normalized query -> (tag graph generation, QueryPlan)
+plan_cache = LRUCache(settings.plan_cache_size)
+
+
+async def compile_query(session: AsyncSession, query: str) -> QueryPlan:
+    """
+    Parse a query, resolve its tags in one lookup and order it by selectivity.
+    Plans are cached until tag names, aliases or implications change; other
+    writes leave them valid, at worst with conjuncts ordered by slightly
+    outdated usage counts.
+    """
+    key = normalize_query(query)
+    generation = tag_graph_generation.value
+    cached = plan_cache.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    root = expand_wildcards(QueryParser(tokenize(key)).parse())
+    expand_implied = any(
+        isinstance(c, FilterNode) and c.key == "expand" and c.value == "implied"
+        for c in root.children
+    )
+    tags = await resolve_tags(session, collect_tag_names(root))
+    root = optimize(resolve_node(root, tags, expand_implied))
+
+    canonical = wrap_canonical(root) if not isinstance(root, AndNode) else root.canonical()
+    if expand_implied:
+        canonical = f"expand:implied {canonical}"
+
+    if is_empty(root):
+        plan = QueryPlan(canonical=canonical, empty=True)
+    else:
+        conjuncts = root.children if isinstance(root, AndNode) else [root]
+        tag_parts = [c for c in conjuncts if is_tag_only(c)]
+        plan = QueryPlan(
+            canonical=canonical,
+            tags=AndNode(tag_parts) if tag_parts else None,
+            filters=[c for c in conjuncts if not is_tag_only(c)],
+        )
+
+    plan_cache.set(key, (generation, plan))
+    return plan
+
+
+def node_condition(node):
+    """SQL condition for a resolved node."""
+    if not IS_SQLITE:
+        return array_condition(node)
+    if isinstance(node, TagNode):
+        if node.implied_by:
+            tag_match = PostTag.c.tag_id.in_((node.tag_id,) + node.implied_by)
+        else:
+            tag_match = PostTag.c.tag_id == node.tag_id
+        return Post.id.in_(select(PostTag.c.post_id).where(tag_match))
+    if isinstance(node, FilterNode):
+        return node.condition
+    if isinstance(node, NotNode):
+        return not_(node_condition(node.child))
+    if isinstance(node, OrNode):
+        return or_(*[node_condition(c) for c in node.children])
+    return and_(*[node_condition(c) for c in node.children])
+
+
+def array_condition(node):
+    """
+    PostgreSQL form of node_condition. Tag terms test the GIN-indexed
+    posts.tag_ids array, with sibling tags merged into a single @> (all of)
+    or && (any of) test.
+    """
+    if isinstance(node, TagNode):
+        if node.implied_by:
+            return Post.tag_ids.overlap([node.tag_id, *node.implied_by])
+        return Post.tag_ids.contains([node.tag_id])
+    if isinstance(node, FilterNode):
+        return node.condition
+    if isinstance(node, NotNode):
+        return not_(array_condition(node.child))
+
+    disjunction = isinstance(node, OrNode)
+    tag_ids = []
+    parts = []
+    for child in node.children:
+        if isinstance(child, TagNode) and (disjunction or not child.implied_by):
+            tag_ids.extend((child.tag_id, *child.implied_by))
+        else:
+            parts.append(array_condition(child))
+    if disjunction:
+        return or_(Post.tag_ids.overlap(tag_ids), *parts) if tag_ids else or_(*parts)
+    return and_(Post.tag_ids.contains(tag_ids), *parts) if tag_ids else and_(*parts)
+
+
+def node_bitmap(node):
+    """Evaluate a tag-only node against the tag index. Never mutates index bitmaps."""
+    if isinstance(node, TagNode):
+        if node.implied_by:
+            return BitMap.union(*[tag_index.get(t) for t in (node.tag_id,) + node.implied_by])
+        return tag_index.get(node.tag_id)
+    if isinstance(node, NotNode):
+        return tag_index.universe - node_bitmap(node.child)
+    if isinstance(node, OrNode):
+        return BitMap.union(*[node_bitmap(c) for c in node.children])
+
+    positives = [node_bitmap(c) for c in node.children if not isinstance(c, NotNode)]
+    negatives = [node_bitmap(c.child) for c in node.children if isinstance(c, NotNode)]
+    if positives:
+        # Intersect smallest first so the working set shrinks fastest
+        positives.sort(key=len)
+        result = BitMap.intersection(*positives) if len(positives) > 1 else positives[0].copy()
+    else:
+        result = tag_index.universe
+    if negatives:
+        result = result - BitMap.union(*negatives)
+    return result
+
+
+def id_set_condition(post_ids) -> object:
+    """SQL condition matching a set of post ids, passed as a single JSON parameter."""
+    id_values = func.json_each(json.dumps(list(post_ids))).table_valued("value")
+    return Post.id.in_(select(id_values.c.value))
+
+
+# Sort keys accepted by search_posts
+SORT_COLUMNS = {
+    "date": Post.created_at,
+    "id": Post.id,
+    "size": Post.file_size,
+    "width": Post.width,
+    "height": Post.height,
+}
+
+
+@dataclass
+class Cursor:
+    """Position of a post in a sorted result set, for keyset pagination."""
+    sort: str
+    order: str
+    value: object
+    post_id: int
+    direction: str = "next"  # next or prev
+
+
+# Columns a post list needs, loaded as plain rows rather than ORM objects:
+# every posts column except the PostgreSQL tag array, plus the favorite flag
+LIST_COLUMNS = [column for column in Post.__table__.columns if column.key != "tag_ids"]
+
+
+def post_rows_select():
+    """Core select of post rows for list pages, serialized by post_dicts()."""
+    return select(*LIST_COLUMNS, exists().where(Favorite.post_id == Post.id).label("is_favorited"))
+
+
+async def post_dicts(session: AsyncSession, rows, with_tags: bool = True) -> list[dict]:
+    """
+    Serialize rows from post_rows_select(), loading every tag name in one
+    query. Without `with_tags` the tag query is skipped and tags are empty.
+    """
+    if not rows:
+        return []
+    if not with_tags:
+        return [post_to_dict(row, [], row.is_favorited) for row in rows]
+    result = await session.execute(
+        select(PostTag.c.post_id, Tag.name)
+        .join(Tag, Tag.id == PostTag.c.tag_id)
+        .where(PostTag.c.post_id.in_([row.id for row in rows]))
+    )
+    tags = defaultdict(list)
+    for post_id, name in result:
+        tags[post_id].append(name)
+    return [post_to_dict(row, tags.get(row.id, []), row.is_favorited) for row in rows]
+
+
+async def tag_meta(session: AsyncSession, names) -> dict[str, dict]:
+    """
+    Category, color and usage count of each named tag, deduplicated. Served
+    from tag_meta_cache until tags, categories or post tags change; names
+    missing from it are loaded in one query.
+    """
+    generation = tag_data_generation.value
+    meta = {}
+    missing = []
+    for name in dict.fromkeys(names):
+        cached = tag_meta_cache.get(name)
+        if cached is not None and cached[0] == generation:
+            meta[name] = cached[1]
+        else:
+            missing.append(name)
+
+    if missing:
+        result = await session.execute(
+            select(Tag.name, Tag.usage_count, TagCategory.name, TagCategory.color)
+            .outerjoin(TagCategory, TagCategory.id == Tag.category_id)
+            .where(Tag.name.in_(missing))
+        )
+        for name, usage_count, category, color in result:
+            meta[name] = {
+                "category": category or "general",
+                "categoryColor": color or "#808080",
+                "usageCount": usage_count,
+            }
+            tag_meta_cache.set(name, (generation, meta[name]))
+    return meta
+
+
+@dataclass
+class SearchResult:
+    posts: list  # Rows from post_rows_select()
+    total: Optional[int]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total_exact: bool = True
+    seed: Optional[int] = None
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query string, used as a cache key."""
+    return " ".join(query.split())
+
+
+async def count_posts(session: AsyncSession, conditions: list) -> int:
+    """Exact number of posts matching all conditions."""
+    count_stmt = select(func.count(Post.id))
+    if conditions:
+        count_stmt = count_stmt.where(and_(*conditions))
+    total_result = await session.execute(count_stmt)
+    return total_result.scalar() or 0
+
+
+async def cached_count(session: AsyncSession, key: str, conditions: list, mode: str = "exact") -> tuple[int, bool]:
+    """
+    Count matching posts through the count cache.
+
+    Exact mode only accepts entries from the current write generation. Estimate
+    mode accepts a stale entry, or extrapolates from a uniform sample of post
+    ids. Returns (count, is_exact).
+    """
+    generation = library_generation.value
+    cached = count_cache.get(key)
+    if cached is not None and (cached[0] == generation or mode == "estimate"):
+        return cached[1], cached[0] == generation
+
+    if mode == "estimate" and not IS_SQLITE:
+        return await planner_estimate(session, conditions), False
+    if mode == "estimate" and conditions:
+        estimate = await estimate_count(session, conditions)
+        if estimate is not None:
+            return estimate, False
+
+    total = await count_posts(session, conditions)
+    count_cache.set(key, (generation, total))
+    return total, True
+
+
+async def estimate_count(session: AsyncSession, conditions: list) -> Optional[int]:
+    """
+    Estimate the number of matching posts from ids drawn uniformly over the
+    whole id range, so old and new posts weigh the same. The draw is seeded
+    with the newest id and stays the same until a post is added. Returns None
+    when the library is small enough to count exactly.
+    """
+    sample_size = settings.count_estimate_sample
+    bounds = await session.execute(select(func.min(Post.id), func.max(Post.id)))
+    min_id, max_id = bounds.one()
+    if min_id is None or max_id - min_id < sample_size:
+        return None
+
+    span = max_id - min_id + 1
+    sample = id_set_condition(min_id + permute(i, span, max_id) for i in range(sample_size))
+    # Deleted posts leave gaps in the range: only ids that exist count
+    sampled = await count_posts(session, [sample])
+    if not sampled:
+        return None
+    matched = await count_posts(session, conditions + [sample])
+    library_size, _ = await cached_count(session, "", [])
+    return round(library_size * matched / sampled)
+
+
+async def planner_estimate(session: AsyncSession, conditions: list) -> int:
+    """PostgreSQL's own row estimate for the matching posts, read from EXPLAIN."""
+    stmt = select(Post.id).where(*conditions)
+    compiled = stmt.compile(dialect=session.bind.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    connection = await session.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def encode_cursor(post, sort: str, sort_order: str, direction: str = "next") -> str:
+    """Build an opaque cursor pointing at a post (a Post or post row)."""
+    value = getattr(post, SORT_COLUMNS[sort].key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = {"s": sort, "o": sort_order, "v": value, "id": post.id, "d": direction}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, sort_order: str) -> Cursor:
+    """Parse an opaque cursor. Raises ValueError if it is malformed or for another sort."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        parsed = Cursor(
+            sort=payload["s"],
+            order=payload["o"],
+            value=payload["v"],
+            post_id=int(payload["id"]),
+            direction=payload.get("d", "next"),
+        )
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    if parsed.sort != sort or parsed.order != sort_order:
+        raise ValueError("Cursor does not match the requested sort")
+    if parsed.direction not in ("next", "prev"):
+        raise ValueError("Invalid cursor")
+    if sort == "date" and parsed.value is not None:
+        parsed.value = datetime.fromisoformat(parsed.value)
+    return parsed
+
+
+def seek_condition(order_col, value, post_id: int, descending: bool):
+    """
+    SQL condition selecting rows strictly after (value, post_id) in sort order.
+    NULL sort values order before everything else, as in SQLite (and in
+    search_posts' explicit NULLS FIRST/LAST ordering on PostgreSQL).
+    """
+    if descending:
+        if value is None:
+            return and_(order_col.is_(None), Post.id < post_id)
+        return or_(tuple_(order_col, Post.id) < tuple_(value, post_id), order_col.is_(None))
+    if value is None:
+        return or_(and_(order_col.is_(None), Post.id > post_id), order_col.is_not(None))
+    return tuple_(order_col, Post.id) > tuple_(value, post_id)
+
+
+MASK64 = (1 << 64) - 1
+
+
+def mix(value: int, seed: int, round_key: int) -> int:
+    """Feistel round function: a splitmix64 finalizer over the keyed input."""
+    z = (value * 0x9E3779B97F4A7C15 + seed * 0xBF58476D1CE4E5B9 + round_key) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def permute(index: int, size: int, seed: int) -> int:
+    """
+    Map index in [0, size) to a unique position in [0, size), pseudo-randomly
+    for a given seed. A keyed Feistel network with cycle walking, so any page
+    of a shuffled ordering is computed directly without sorting.
+    """
+    bits = max((size - 1).bit_length(), 2)
+    bits += bits % 2
+    half = bits // 2
+    mask = (1 << half) - 1
+    x = index
+    while True:
+        left, right = x >> half, x & mask
+        for round_key in range(4):
+            left, right = right, left ^ (mix(right, seed, round_key) & mask)
+        x = (left << half) | right
+        if x < size:
+            return x
+
+
+async def candidate_ids(session: AsyncSession, plan: QueryPlan, conditions: list, candidates=None):
+    """
+    Ordered ids of every matching post, cached per canonical query until the
+    next write. With `candidates` from the tag index, SQL only evaluates the
+    filters, restricted to those ids when there are few enough to inline and
+    intersected with them in memory otherwise.
+    """
+    generation = library_generation.value
+    cached = candidate_cache.get(plan.canonical)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    if candidates is not None:
+        conditions = [node_condition(node) for node in plan.filters]
+        if len(candidates) <= settings.tag_index_inline_limit:
+            conditions.insert(0, id_set_condition(candidates))
+    result = await session.execute(select(Post.id).where(*conditions).order_by(Post.id))
+    ids = result.scalars().all()
+    ids = BitMap(ids) if BitMap is not None else list(ids)
+    if candidates is not None:
+        ids &= candidates
+    candidate_cache.set(plan.canonical, (generation, ids))
+    return ids
+
+
+async def random_page(
+    session: AsyncSession,
+    plan: QueryPlan,
+    candidates,
+    conditions: list,
+    page: int,
+    per_page: int,
+    seed: int,
+) -> SearchResult:
+    """A page of a seeded shuffle, sampled by rank from the candidate id set."""
+    if candidates is None and plan.tags is None and tag_index.ready:
+        # No tag terms: every post is a candidate, no need to scan for them
+        candidates = tag_index.universe
+    if candidates is not None and not plan.filters:
+        ids = candidates
+    else:
+        ids = await candidate_ids(session, plan, conditions, candidates)
+
+    total = len(ids)
+    offset = (page - 1) * per_page
+    page_ids = [ids[permute(i, total, seed)] for i in range(offset, min(offset + per_page, total))]
+    if not page_ids:
+        return SearchResult(posts=[], total=total, seed=seed)
+
+    result = await session.execute(post_rows_select().where(Post.id.in_(page_ids)))
+    by_id = {row.id: row for row in result}
+    return SearchResult(
+        posts=[by_id[post_id] for post_id in page_ids if post_id in by_id],
+        total=total,
+        seed=seed,
+    )
+
+
+async def random_post(session: AsyncSession, query: str = "") -> Optional[Post]:
+    """
+    One random post matching a query. Samples the bitmap candidates when the
+    tag index covers the query, otherwise probes a random id range.
+    """
+    plan = await compile_query(session, query)
+    if plan.empty:
+        return None
+    candidates, conditions = plan_conditions(plan)
+    stmt = select(Post).options(selectinload(Post.tags), selectinload(Post.favorite))
+
+    if candidates is not None and not plan.filters:
+        if not candidates:
+            return None
+        post_id = candidates[random.randrange(len(candidates))]
+        result = await session.execute(stmt.where(Post.id == post_id))
+        return result.scalars().first()
+
+    bounds = await session.execute(select(func.min(Post.id), func.max(Post.id)))
+    low, high = bounds.one()
+    if low is None:
+        return None
+    pivot = random.randint(low, high)
+    result = await session.execute(
+        stmt.where(*conditions, Post.id >= pivot).order_by(Post.id.asc()).limit(1)
+    )
+    post = result.scalars().first()
+    if post is None:
+        result = await session.execute(
+            stmt.where(*conditions, Post.id < pivot).order_by(Post.id.desc()).limit(1)
+        )
+        post = result.scalars().first()
+    return post
+
+
+def bitmap_window(candidates, limit: int, descending: bool, offset: int = 0, after_id: Optional[int] = None):
+    """Slice a page of ids straight out of an id-ordered bitmap."""
+    if descending:
+        end = len(candidates) - offset if after_id is None else candidates.rank(after_id - 1)
+        return candidates[max(end - limit, 0):max(end, 0)]
+    start = offset if after_id is None else candidates.rank(after_id)
+    return candidates[start:start + limit]
+
+
+def plan_conditions(plan: QueryPlan) -> tuple[Optional["BitMap"], list]:
+    """
+    Evaluate a plan's tag terms against the in-memory index when it is
+    available. Returns (candidate ids or None, SQL conditions selecting the
+    matching posts).
+    """
+    candidates = None
+    if tag_index.ready and plan.tags is not None:
+        candidates = node_bitmap(plan.tags)
+
+    filters = [node_condition(node) for node in plan.filters]
+    if candidates is not None and len(candidates) <= settings.tag_index_inline_limit:
+        return candidates, [id_set_condition(candidates)] + filters
+    if plan.tags is not None:
+        return candidates, [node_condition(plan.tags)] + filters
+    return candidates, filters
+
+
 async def search_posts(
     session: AsyncSession,
     query: str = "",
@@ -93,141 +930,300 @@ async def search_posts(
     per_page: int = 40,
     sort: str = "date",
     sort_order: str = "desc",
-) -> tuple[list[Post], int]:
-    """Search posts with tag-based query syntax."""
-    tokens = tokenize(query) if query else []
-
-    # Base query with eager loading
-    stmt = select(Post).options(
-        selectinload(Post.tags),
-        selectinload(Post.favorite),
-    )
+    cursor: Optional[str] = None,
+    count: str = "exact",
+    seed: Optional[int] = None,
+) -> SearchResult:
+    """
+    Search posts with tag-based query syntax.
 
-    # Track conditions
-    and_conditions = []
-    or_groups = []
-    current_or_group = []
+    Pages by offset, or by keyset when a cursor from a previous result is given.
+    `count` is one of exact, estimate or none; with none the total is skipped.
+    sort=random shuffles with `seed` (picked if omitted), stable across pages.
+    """
+    if sort == "random":
+        cursor = None
+        if seed is None:
+            seed = random.randrange(1 << 31)
+    elif sort not in SORT_COLUMNS:
+        sort = "date"
+    if sort_order != "asc":
+        sort_order = "desc"
+    position = decode_cursor(cursor, sort, sort_order) if cursor else None
 
-    for token in tokens:
-        if token.type == TokenType.TAG:
-            # Tag must be present
-            subq = select(PostTag.c.post_id).join(Tag).where(Tag.name == token.value)
-            condition = Post.id.in_(subq)
-            if current_or_group:
-                current_or_group.append(condition)
-            else:
-                and_conditions.append(condition)
-
-        elif token.type == TokenType.NEGATED_TAG:
-            # Tag must NOT be present
-            subq = select(PostTag.c.post_id).join(Tag).where(Tag.name == token.value)
-            and_conditions.append(not_(Post.id.in_(subq)))
-
-        elif token.type == TokenType.OR:
-            # Start collecting for OR group
-            if and_conditions:
-                current_or_group = [and_conditions.pop()]
-
-        elif token.type == TokenType.FILTER:
-            condition = apply_filter(token)
-            if condition is not None:
-                and_conditions.append(condition)
-
-        elif token.type == TokenType.NEGATED_FILTER:
-            condition = apply_filter(token)
-            if condition is not None:
-                and_conditions.append(not_(condition))
-
-        # If we have an OR group and encounter something else, close it
-        if current_or_group and token.type not in (TokenType.OR,) and token.type == TokenType.TAG:
-            if len(current_or_group) > 1:
-                or_groups.append(or_(*current_or_group))
-                current_or_group = []
-
-    # Handle any remaining OR group
-    if current_or_group:
-        or_groups.append(or_(*current_or_group))
-
-    # Combine all conditions
-    all_conditions = and_conditions + or_groups
-    if all_conditions:
-        stmt = stmt.where(and_(*all_conditions))
+    plan = await compile_query(session, query)
+    if plan.empty:
+        return SearchResult(posts=[], total=0, seed=seed)
+
+    candidates, all_conditions = plan_conditions(plan)
+    if candidates is not None and not candidates:
+        return SearchResult(posts=[], total=0, seed=seed)
+    filters = plan.filters
+
+    if sort == "random":
+        return await random_page(session, plan, candidates, all_conditions, page, per_page, seed)
 
     # Get total count
-    count_stmt = select(func.count(Post.id))
-    if all_conditions:
-        count_stmt = count_stmt.where(and_(*all_conditions))
-    total_result = await session.execute(count_stmt)
-    total = total_result.scalar() or 0
-
-    # Apply sorting
-    if sort == "date":
-        order_col = Post.created_at
-    elif sort == "id":
-        order_col = Post.id
-    elif sort == "size":
-        order_col = Post.file_size
-    elif sort == "width":
-        order_col = Post.width
-    elif sort == "height":
-        order_col = Post.height
+    total_exact = True
+    if count == "none":
+        total, total_exact = None, False
+    elif candidates is not None and not filters:
+        total = len(candidates)
     else:
-        order_col = Post.created_at
+        total, total_exact = await cached_count(session, plan.canonical, all_conditions, count)
 
-    if sort_order == "asc":
-        stmt = stmt.order_by(order_col.asc())
+    order_col = SORT_COLUMNS[sort]
+    backwards = position is not None and position.direction == "prev"
+    # Walking backwards scans in the opposite order, then flips the page
+    descending = (sort_order == "desc") != backwards
+    offset = 0 if position else (page - 1) * per_page
+    # Without a reliable total, fetch one extra row to learn whether more remain
+    probe = position is not None or total is None or not total_exact
+    limit = per_page + 1 if probe else per_page
+
+    stmt = post_rows_select()
+
+    if candidates is not None and not filters and sort == "id":
+        # Ids are already ordered in the bitmap, so slice the page directly
+        page_ids = bitmap_window(
+            candidates, limit, descending, offset, position.post_id if position else None
+        )
+        stmt = stmt.where(Post.id.in_(list(page_ids)))
     else:
-        stmt = stmt.order_by(order_col.desc())
+        if position:
+            all_conditions.append(seek_condition(order_col, position.value, position.post_id, descending))
+        if all_conditions:
+            stmt = stmt.where(and_(*all_conditions))
+        stmt = stmt.offset(offset).limit(limit)
 
-    # Apply pagination
-    stmt = stmt.offset((page - 1) * per_page).limit(per_page)
+    if descending:
+        primary = order_col.desc() if IS_SQLITE else order_col.desc().nulls_last()
+        stmt = stmt.order_by(primary, Post.id.desc())
+    else:
+        primary = order_col.asc() if IS_SQLITE else order_col.asc().nulls_first()
+        stmt = stmt.order_by(primary, Post.id.asc())
 
     result = await session.execute(stmt)
-    posts = list(result.scalars().all())
+    posts = list(result)
+
+    if probe:
+        has_more = len(posts) > per_page
+        posts = posts[:per_page]
+    if position:
+        if backwards:
+            posts.reverse()
+        has_next = has_more if not backwards else True
+        has_prev = has_more if backwards else True
+    else:
+        has_next = has_more if probe else offset + len(posts) < total
+        has_prev = page > 1
+
+    return SearchResult(
+        posts=posts,
+        total=total,
+        next_cursor=encode_cursor(posts[-1], sort, sort_order) if posts and has_next else None,
+        prev_cursor=encode_cursor(posts[0], sort, sort_order, "prev") if posts and has_prev else None,
+        total_exact=total_exact,
+    )
+
+
+async def search_facets(session: AsyncSession, query: str = "", limit: int = 25) -> dict:
+    """
+    Top tags, safety distribution and type distribution over every post
+    matching a query, each computed with one grouped aggregate.
+    Cached per canonical query until the next library write.
+    """
+    plan = await compile_query(session, query)
+    generation = library_generation.value
+    key = (plan.canonical, limit)
+    cached = facet_cache.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    facets = {"total": 0, "tags": [], "safety": {}, "types": {}}
+    candidates, conditions = plan_conditions(plan) if not plan.empty else (None, [])
+    if plan.empty or (candidates is not None and not candidates):
+        facet_cache.set(key, (generation, facets))
+        return facets
+
+    tag_stmt = (
+        select(Tag.name, TagCategory.name, TagCategory.color, func.count().label("count"))
+        .select_from(PostTag)
+        .join(Tag, Tag.id == PostTag.c.tag_id)
+        .outerjoin(TagCategory, TagCategory.id == Tag.category_id)
+    )
+    if conditions:
+        matching = select(Post.id).where(and_(*conditions))
+        tag_stmt = tag_stmt.where(PostTag.c.post_id.in_(matching))
+        tag_stmt = tag_stmt.group_by(Tag.id, TagCategory.id).order_by(func.count().desc(), Tag.name).limit(limit)
+    else:
+        # Whole library: usage_count already holds the per-tag totals
+        tag_stmt = (
+            select(Tag.name, TagCategory.name, TagCategory.color, Tag.usage_count)
+            .outerjoin(TagCategory, TagCategory.id == Tag.category_id)
+            .where(Tag.usage_count > 0)
+            .order_by(Tag.usage_count.desc(), Tag.name)
+            .limit(limit)
+        )
+    tag_result = await session.execute(tag_stmt)
+    facets["tags"] = [
+        {"name": name, "category": category or "general", "categoryColor": color or "#808080", "count": tag_count}
+        for name, category, color, tag_count in tag_result
+    ]
+
+    safety_result = await session.execute(
+        select(Post.safety, func.count()).where(*conditions).group_by(Post.safety)
+    )
+    facets["safety"] = {safety: post_count for safety, post_count in safety_result}
+
+    type_result = await session.execute(
+        select(Post.extension, func.count()).where(*conditions).group_by(Post.extension)
+    )
+    types = {}
+    for extension, post_count in type_result:
+        media_type = EXTENSION_TYPES.get(extension, "other")
+        types[media_type] = types.get(media_type, 0) + post_count
+    facets["types"] = types
+    facets["total"] = sum(facets["safety"].values())
+
+    facet_cache.set(key, (generation, facets))
+    return facets
+
+
+SIZE_UNITS = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def parse_size(value: str) -> int:
+    """Parse a file size like `500`, `512KB` or `1.5GB` into bytes."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmg]?b)?", value.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or "b"])
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration like `30`, `45s`, `2m`, `1h` or `1:30` into seconds."""
+    value = value.strip().lower()
+    if ":" in value:
+        seconds = 0.0
+        for part in value.split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smh]?)", value)
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
 
-    return posts, total
 
+def parse_date(value: str) -> tuple[datetime, datetime]:
+    """Parse `YYYY`, `YYYY-MM`, `YYYY-MM-DD` or an ISO timestamp into a [start, end) interval."""
+    value = value.strip()
+    if re.fullmatch(r"\d{4}", value):
+        year = int(value)
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    if re.fullmatch(r"\d{4}-\d{1,2}", value):
+        year, month = (int(part) for part in value.split("-"))
+        start = datetime(year, month, 1)
+        return start, datetime(year + month // 12, month % 12 + 1, 1)
+    start = datetime.fromisoformat(value)
+    if len(value) <= 10:
+        return start, start + timedelta(days=1)
+    return start, start
 
-def apply_filter(token: Token):
-    """Apply a filter token to the query."""
-    key = token.filter_key
-    value = token.filter_value if hasattr(token, "filter_value") else token.value
-    op = token.filter_op
+
+def compare(column, op: str, value: str, parse=int):
+    """
+    Comparison filter over a numeric column. Supports `>`, `>=`, `<`, `<=`,
+    equality and inclusive `low..high` ranges with either end open.
+    Returns None if the value does not parse.
+    """
+    try:
+        if ".." in value:
+            low, _, high = value.partition("..")
+            bounds = []
+            if low:
+                bounds.append(column >= parse(low))
+            if high:
+                bounds.append(column <= parse(high))
+            return and_(*bounds) if bounds else None
+
+        val = parse(value)
+    except ValueError:
+        return None
+
+    if op == ">=":
+        return column >= val
+    elif op == "<=":
+        return column <= val
+    elif op == ">":
+        return column > val
+    elif op == "<":
+        return column < val
+    else:
+        return column == val
+
+
+def compare_date(column, op: str, value: str):
+    """Like compare(), but a date matches its whole day (or month, or year)."""
+    try:
+        if ".." in value:
+            low, _, high = value.partition("..")
+            bounds = []
+            if low:
+                bounds.append(column >= parse_date(low)[0])
+            if high:
+                start, end = parse_date(high)
+                bounds.append(column < end if end > start else column <= end)
+            return and_(*bounds) if bounds else None
+
+        start, end = parse_date(value)
+    except ValueError:
+        return None
+
+    if end == start:
+        return compare(column, op, value, lambda v: parse_date(v)[0])
+    if op == ">=":
+        return column >= start
+    elif op == "<=":
+        return column < end
+    elif op == ">":
+        return column >= end
+    elif op == "<":
+        return column < start
+    else:
+        return and_(column >= start, column < end)
+
+
+def apply_filter(node: FilterNode):
+    """Build the SQL condition for a filter term, or None if it does not apply."""
+    key = node.key
+    value = node.value
+    op = node.op
 
     if key == "rating" or key == "safety":
         return Post.safety == value
 
     elif key == "width":
-        try:
-            val = int(value)
-            if op == ">=":
-                return Post.width >= val
-            elif op == "<=":
-                return Post.width <= val
-            elif op == ">":
-                return Post.width > val
-            elif op == "<":
-                return Post.width < val
-            else:
-                return Post.width == val
-        except ValueError:
-            return None
+        return compare(Post.width, op, value)
 
     elif key == "height":
-        try:
-            val = int(value)
-            if op == ">=":
-                return Post.height >= val
-            elif op == "<=":
-                return Post.height <= val
-            elif op == ">":
-                return Post.height > val
-            elif op == "<":
-                return Post.height < val
-            else:
-                return Post.height == val
-        except ValueError:
-            return None
+        return compare(Post.height, op, value)
+
+    elif key == "id":
+        return compare(Post.id, op, value)
+
+    elif key == "filesize" or key == "size":
+        return compare(Post.file_size, op, value, parse_size)
+
+    elif key == "duration":
+        return compare(Post.duration, op, value, parse_duration)
+
+    elif key == "tagcount":
+        return compare(Post.tag_count, op, value)
+
+    elif key == "date" or key == "created":
+        return compare_date(Post.created_at, op, value)
 
     elif key == "fav" or key == "favorite":
         if value.lower() in ("true", "yes", "1"):
@@ -243,15 +1239,21 @@ def apply_filter(token: Token):
             return None
 
     elif key == "type":
-        if value == "image":
-            return Post.extension.in_([".jpg", ".jpeg", ".png", ".webp"])
-        elif value == "gif":
-            return Post.extension == ".gif"
-        elif value == "video":
-            return Post.extension.in_([".webm", ".mp4"])
+        extensions = [ext for ext, media_type in EXTENSION_TYPES.items() if media_type == value]
+        if extensions:
+            return Post.extension.in_(extensions)
+
+    elif key == "text" or key == "source" or key == "filename":
+        if not value.strip('"* '):
+            return None
+        return fulltext_index.condition(key, value)
 
     elif key == "sort":
         # Sorting is handled separately
         return None
 
+    elif key == "expand":
+        # Query-wide mode, applied while compiling the plan
+        return None
+
     return None
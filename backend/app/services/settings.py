@@ -91,7 +91,14 @@ def migrate_data_directory(old_dir: Path, new_dir: Path) -> dict:
         
         for item in old_dir.iterdir():
             dest = new_dir / item.name
-            if item.is_dir():
+            if item.name == "nekobooru.db":
+                # Copy through SQLite so a write in progress can't tear the copy
+                from .backup import copy_database
+                copy_database(item, dest)
+                copied_files += 1
+            elif item.name in ("nekobooru.db-wal", "nekobooru.db-shm"):
+                continue  # Already included in the copied database
+            elif item.is_dir():
                 shutil.copytree(item, dest, dirs_exist_ok=True)
                 copied_dirs += 1
             else:
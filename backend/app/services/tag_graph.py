@@ -0,0 +1,108 @@
+"""In-memory view of tag aliases and implications."""
+import logging
+from typing import Optional
+
+from sqlalchemy import select
+
+from ..database import read_session
+from ..models import TagAlias, TagImplication
+from .cache import library_generation, tag_graph_generation
+
+logger = logging.getLogger(__name__)
+
+
+class TagGraph:
+    """
+    Alias name -> tag id map and precomputed implication closure, in both
+    directions: the tags each tag implies (for tag writes) and the tags that
+    imply it (for search).
+
+    Loaded at startup and reloaded whenever aliases or implications change,
+    so search and tag writes resolve aliases and implied tags without extra
+    queries. Implication chains are followed to any depth; tags on a cycle
+    are reported in `cyclic` and the walk stops at them.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.aliases: dict[str, int] = {}
+        self.cyclic: frozenset[int] = frozenset()
+        self._implies: dict[int, frozenset[int]] = {}
+        self._implied_by: dict[int, frozenset[int]] = {}
+
+    async def load(self):
+        """(Re)load aliases and implications from the database."""
+        async with read_session() as session:
+            alias_result = await session.execute(select(TagAlias.alias_name, TagAlias.target_id))
+            aliases = {name: target_id for name, target_id in alias_result}
+
+            edge_result = await session.execute(
+                select(TagImplication.antecedent_id, TagImplication.consequent_id)
+            )
+            consequents: dict[int, set[int]] = {}
+            antecedents: dict[int, set[int]] = {}
+            for antecedent_id, consequent_id in edge_result:
+                consequents.setdefault(antecedent_id, set()).add(consequent_id)
+                antecedents.setdefault(consequent_id, set()).add(antecedent_id)
+
+        implies = {}
+        cyclic = set()
+        for tag_id in consequents:
+            closure = self.walk(tag_id, consequents)
+            if tag_id in closure:
+                cyclic.add(tag_id)
+                closure.discard(tag_id)
+            implies[tag_id] = frozenset(closure)
+
+        self.aliases = aliases
+        self.cyclic = frozenset(cyclic)
+        self._implies = implies
+        self._implied_by = {
+            tag_id: frozenset(self.walk(tag_id, antecedents) - {tag_id}) for tag_id in antecedents
+        }
+        self.ready = True
+        # Query plans and results cached while the old graph was in place are stale
+        tag_graph_generation.bump()
+        library_generation.bump()
+        if cyclic:
+            logger.warning(f"Tag implications contain cycles through tag ids {sorted(cyclic)}")
+        logger.info(f"Tag graph loaded: {len(aliases)} aliases, {len(antecedents)} implied tags")
+
+    @staticmethod
+    def walk(start: int, edges: dict[int, set[int]]) -> set[int]:
+        """All nodes reachable from start; includes start only if it is on a cycle."""
+        seen = set()
+        stack = list(edges.get(start, ()))
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.extend(edges.get(node, ()))
+        return seen
+
+    def resolve_alias(self, name: str) -> Optional[int]:
+        """Target tag id of an alias, or None."""
+        return self.aliases.get(name)
+
+    def implies(self, tag_id: int) -> frozenset[int]:
+        """Ids of every tag that tag_id directly or transitively implies."""
+        return self._implies.get(tag_id, frozenset())
+
+    def expand(self, tag_ids) -> set[int]:
+        """tag_ids plus every tag they imply."""
+        expanded = set(tag_ids)
+        for tag_id in tag_ids:
+            expanded |= self._implies.get(tag_id, frozenset())
+        return expanded
+
+    def would_cycle(self, antecedent_id: int, consequent_id: int) -> bool:
+        """True if adding antecedent -> consequent would close an implication cycle."""
+        return antecedent_id == consequent_id or antecedent_id in self.implies(consequent_id)
+
+    def implied_by(self, tag_id: int) -> frozenset[int]:
+        """Ids of every tag that directly or transitively implies tag_id."""
+        return self._implied_by.get(tag_id, frozenset())
+
+
+tag_graph = TagGraph()
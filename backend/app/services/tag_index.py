@@ -0,0 +1,126 @@
+"""In-memory inverted index mapping tags to bitmaps of post ids."""
+import logging
+from typing import Iterable
+
+from sqlalchemy import select
+
+from ..config import settings
+from ..database import IS_SQLITE, read_session
+from ..models import Post
+from ..models.post import PostTag
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = None
+
+
+class TagIndex:
+    """
+    Inverted index of tag_id -> compressed bitmap of post ids.
+
+    Built once at startup from post_tags and kept current by the post
+    create/update/delete routes, so boolean tag queries run as in-memory
+    bitmap operations and SQL only has to hydrate the final page.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._tags: dict = {}
+        self._posts = None
+
+    @property
+    def available(self) -> bool:
+        """Whether the index can be used on this installation."""
+        return BitMap is not None and settings.tag_index_enabled and IS_SQLITE
+
+    async def build(self):
+        """Load every post and tag association from the database."""
+        self.ready = False
+        if not settings.tag_index_enabled:
+            return
+        if BitMap is None:
+            logger.info("pyroaring is not installed; tag index disabled")
+            return
+        if not IS_SQLITE:
+            # Searched through the GIN-indexed posts.tag_ids array instead
+            logger.info("Using PostgreSQL tag arrays; tag index disabled")
+            return
+
+        async with read_session() as session:
+            post_result = await session.execute(select(Post.id))
+            posts = BitMap(post_result.scalars().all())
+
+            tag_posts: dict[int, list[int]] = {}
+            link_result = await session.execute(select(PostTag.c.tag_id, PostTag.c.post_id))
+            for tag_id, post_id in link_result:
+                tag_posts.setdefault(tag_id, []).append(post_id)
+
+        self._posts = posts
+        self._tags = {tag_id: BitMap(post_ids) for tag_id, post_ids in tag_posts.items()}
+        self.ready = True
+        logger.info(f"Tag index built: {len(self._tags)} tags over {len(posts)} posts")
+
+    def add_post(self, post_id: int, tag_ids: Iterable[int]):
+        """Register a post and the tags it carries."""
+        if not self.ready:
+            return
+        self._posts.add(post_id)
+        for tag_id in tag_ids:
+            bitmap = self._tags.get(tag_id)
+            if bitmap is None:
+                bitmap = self._tags[tag_id] = BitMap()
+            bitmap.add(post_id)
+
+    def set_post_tags(self, post_id: int, old_tag_ids: Iterable[int], new_tag_ids: Iterable[int]):
+        """Replace the tags recorded for a post."""
+        if not self.ready:
+            return
+        for tag_id in old_tag_ids:
+            bitmap = self._tags.get(tag_id)
+            if bitmap is not None:
+                bitmap.discard(post_id)
+        self.add_post(post_id, new_tag_ids)
+
+    def retag_posts(self, post_ids: Iterable[int], added_tag_ids: Iterable[int], removed_tag_ids: Iterable[int] = ()):
+        """Add and remove tags on many existing posts at once."""
+        if not self.ready:
+            return
+        posts = BitMap(post_ids)
+        for tag_id in removed_tag_ids:
+            bitmap = self._tags.get(tag_id)
+            if bitmap is not None:
+                bitmap.difference_update(posts)
+        for tag_id in added_tag_ids:
+            bitmap = self._tags.get(tag_id)
+            if bitmap is None:
+                bitmap = self._tags[tag_id] = BitMap()
+            bitmap.update(posts)
+
+    def remove_post(self, post_id: int, tag_ids: Iterable[int]):
+        """Forget a deleted post."""
+        if not self.ready:
+            return
+        self.set_post_tags(post_id, tag_ids, [])
+        self._posts.discard(post_id)
+
+    def remove_tag(self, tag_id: int):
+        """Forget a deleted tag."""
+        if not self.ready:
+            return
+        self._tags.pop(tag_id, None)
+
+    @property
+    def universe(self) -> "BitMap":
+        """Bitmap of every post id."""
+        return self._posts
+
+    def get(self, tag_id: int) -> "BitMap":
+        """Bitmap of the posts carrying a tag. Callers must not mutate it."""
+        bitmap = self._tags.get(tag_id)
+        return bitmap if bitmap is not None else BitMap()
+
+
+tag_index = TagIndex()
@@ -0,0 +1,288 @@
+"""Background jobs applying new implications and aliases to already tagged posts."""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from ..config import settings
+from ..database import IS_SQLITE, read_session, upsert
+from ..models import Post, Tag, TagAlias, TagImplication
+from ..models.post import PostTag
+from .tag_graph import TagGraph, tag_graph
+from .tag_index import tag_index
+from .tag_names import tag_name_index
+from .writer import on_commit, write_coordinator
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for the status endpoint
+JOB_HISTORY = 50
+
+
+async def refresh_tag_counts(db, post_ids: Iterable[int]):
+    """Recompute the denormalized tag_count (and tag_ids on PostgreSQL) of posts from post_tags."""
+    values = {
+        "tag_count": select(func.count()).where(PostTag.c.post_id == Post.id).scalar_subquery()
+    }
+    if not IS_SQLITE:
+        values["tag_ids"] = func.array(
+            select(PostTag.c.tag_id).where(PostTag.c.post_id == Post.id).scalar_subquery()
+        )
+    await db.execute(Post.__table__.update().where(Post.id.in_(list(post_ids))).values(**values))
+
+
+async def refresh_usage_counts(db, tag_ids: Iterable[int]):
+    """Recompute usage_count of tags from post_tags in one UPDATE."""
+    await db.execute(
+        Tag.__table__.update()
+        .where(Tag.id.in_(list(tag_ids)))
+        .values(usage_count=select(func.count()).where(PostTag.c.tag_id == Tag.id).scalar_subquery())
+    )
+
+
+async def repoint_implications(db, tag_id: int, target_id: int) -> tuple[int, int]:
+    """
+    Move every implication of tag_id, on either side, onto target_id.
+    Implications that would become self-implications or duplicates, or
+    close a cycle (the rule create_implication applies), are deleted
+    instead. Returns how many were moved and deleted.
+    """
+    result = await db.execute(select(TagImplication.id, TagImplication.antecedent_id, TagImplication.consequent_id))
+    edges = result.all()
+
+    # Graph of the implications that stay as they are
+    consequents: dict[int, set[int]] = {}
+    for _, antecedent_id, consequent_id in edges:
+        if tag_id not in (antecedent_id, consequent_id):
+            consequents.setdefault(antecedent_id, set()).add(consequent_id)
+
+    moved, dropped = [], []
+    for impl_id, antecedent_id, consequent_id in edges:
+        if tag_id not in (antecedent_id, consequent_id):
+            continue
+        antecedent_id = target_id if antecedent_id == tag_id else antecedent_id
+        consequent_id = target_id if consequent_id == tag_id else consequent_id
+        if (
+            antecedent_id == consequent_id
+            or consequent_id in consequents.get(antecedent_id, ())
+            or antecedent_id in TagGraph.walk(consequent_id, consequents)
+        ):
+            dropped.append(impl_id)
+            continue
+        consequents.setdefault(antecedent_id, set()).add(consequent_id)
+        moved.append({"impl_id": impl_id, "antecedent_id": antecedent_id, "consequent_id": consequent_id})
+
+    if dropped:
+        logger.warning(
+            f"Dropping {len(dropped)} implications of merged tag {tag_id} that would duplicate "
+            f"an existing one, imply themselves or close a cycle through tag {target_id}"
+        )
+        await db.execute(delete(TagImplication).where(TagImplication.id.in_(dropped)))
+    if moved:
+        await db.execute(
+            TagImplication.__table__.update()
+            .where(TagImplication.id == bindparam("impl_id"))
+            .values(antecedent_id=bindparam("antecedent_id"), consequent_id=bindparam("consequent_id")),
+            moved,
+        )
+    return len(moved), len(dropped)
+
+
+class TagJobQueue:
+    """
+    Applies implications and aliases to posts tagged before they existed.
+
+    - implication: every post carrying the antecedent (or a tag implying it)
+      gets the consequent and everything the consequent implies
+    - alias: posts carrying a tag named like the new alias are moved to the
+      target tag, its aliases and implications are repointed to the target,
+      then the old tag is deleted
+
+    Jobs run one at a time, in the order they were queued. Each walks the
+    affected posts in chunks of settings.tag_job_chunk_size, one write unit
+    per chunk, so other writes interleave with a long job. A chunk inserts
+    the missing post_tags rows with INSERT ... SELECT ... ON CONFLICT DO
+    NOTHING and refreshes the chunk's post tag counts; usage counts are
+    recomputed once, after the last chunk.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._next_id = 1
+        self.jobs: deque[dict] = deque(maxlen=JOB_HISTORY)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the job worker on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for job in self.jobs:
+            if job["state"] in ("queued", "running"):
+                logger.warning(f"Tag job {job['id']} ({job['description']}) interrupted by shutdown")
+                job["state"] = "interrupted"
+
+    def status(self) -> list[dict]:
+        """Queued, running and recent jobs, newest first."""
+        return list(reversed(self.jobs))
+
+    def apply_implication(self, antecedent_id: int, consequent_id: int, description: str) -> dict:
+        """Queue adding consequent (and what it implies) to posts carrying antecedent."""
+        return self._enqueue("implication", description, antecedent_id, consequent_id)
+
+    def apply_alias(self, tag_id: int, target_id: int, description: str) -> dict:
+        """Queue moving the posts of tag_id onto target_id and deleting tag_id."""
+        return self._enqueue("alias", description, tag_id, target_id)
+
+    def _enqueue(self, kind: str, description: str, source_id: int, target_id: int) -> dict:
+        job = {
+            "id": self._next_id,
+            "kind": kind,
+            "description": description,
+            "state": "queued",
+            "queued_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "posts_total": None,
+            "posts_done": 0,
+            "rows_added": 0,
+            "rows_removed": 0,
+        }
+        self._next_id += 1
+        self.jobs.append(job)
+        if self.running:
+            self._queue.put_nowait((job, source_id, target_id))
+        else:
+            job["state"] = "failed"
+            job["error"] = "Tag job worker is not running"
+        return job
+
+    async def _run(self):
+        while True:
+            job, source_id, target_id = await self._queue.get()
+            job["state"] = "running"
+            job["started_at"] = datetime.utcnow().isoformat()
+            try:
+                if job["kind"] == "implication":
+                    await self._run_implication(job, source_id, target_id)
+                else:
+                    await self._run_alias(job, source_id, target_id)
+                job["state"] = "done"
+                logger.info(
+                    f"Tag job {job['id']} ({job['description']}) done: {job['posts_done']} posts, "
+                    f"{job['rows_added']} tags added, {job['rows_removed']} removed"
+                )
+            except Exception as e:
+                logger.exception(f"Tag job {job['id']} ({job['description']}) failed")
+                job["state"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished_at"] = datetime.utcnow().isoformat()
+                self._queue.task_done()
+
+    async def _count_posts(self, tag_ids: set[int]) -> int:
+        async with read_session() as session:
+            result = await session.execute(
+                select(func.count(PostTag.c.post_id.distinct())).where(PostTag.c.tag_id.in_(tag_ids))
+            )
+            return result.scalar() or 0
+
+    async def _apply_chunks(self, job: dict, source_ids: set[int], target_ids: set[int], move: bool):
+        """
+        Give every post carrying one of source_ids all of target_ids, one
+        chunk of posts per write unit. With `move` the source rows are
+        deleted from each chunk afterwards.
+        """
+        job["posts_total"] = await self._count_posts(source_ids)
+        last_post_id = 0
+
+        async def write(db):
+            result = await db.execute(
+                select(PostTag.c.post_id)
+                .where(PostTag.c.tag_id.in_(source_ids), PostTag.c.post_id > last_post_id)
+                .group_by(PostTag.c.post_id)
+                .order_by(PostTag.c.post_id)
+                .limit(settings.tag_job_chunk_size)
+            )
+            post_ids = list(result.scalars().all())
+            if not post_ids:
+                return post_ids, 0, 0
+
+            pairs = (
+                select(Post.id, Tag.id)
+                .join(Tag, Tag.id.in_(target_ids))
+                .where(Post.id.in_(post_ids))
+            )
+            added = await db.execute(
+                upsert(PostTag).from_select(["post_id", "tag_id"], pairs).on_conflict_do_nothing()
+            )
+            removed_count = 0
+            if move:
+                removed = await db.execute(
+                    delete(PostTag).where(PostTag.c.tag_id.in_(source_ids), PostTag.c.post_id.in_(post_ids))
+                )
+                removed_count = removed.rowcount
+            await refresh_tag_counts(db, post_ids)
+            on_commit(db, lambda: tag_index.retag_posts(post_ids, target_ids, source_ids if move else ()))
+            return post_ids, added.rowcount, removed_count
+
+        while True:
+            post_ids, added, removed = await write_coordinator.submit(write)
+            if not post_ids:
+                break
+            last_post_id = post_ids[-1]
+            job["posts_done"] += len(post_ids)
+            job["rows_added"] += added
+            job["rows_removed"] += removed
+
+        async def recount(db):
+            await refresh_usage_counts(db, (source_ids if move else set()) | target_ids)
+
+        await write_coordinator.submit(recount)
+
+    async def _run_implication(self, job: dict, antecedent_id: int, consequent_id: int):
+        # Posts tagged before this change may carry a tag implying the
+        # antecedent without the antecedent itself
+        source_ids = {antecedent_id} | tag_graph.implied_by(antecedent_id)
+        target_ids = {consequent_id} | tag_graph.implies(consequent_id)
+        await self._apply_chunks(job, source_ids, target_ids, move=False)
+
+    async def _run_alias(self, job: dict, tag_id: int, target_id: int):
+        target_ids = {target_id} | tag_graph.implies(target_id)
+        await self._apply_chunks(job, {tag_id}, target_ids, move=True)
+
+        async def merge(db):
+            # Aliases and implications of the old tag move to the target
+            # before the row is deleted, which would cascade to them
+            await db.execute(update(TagAlias).where(TagAlias.target_id == tag_id).values(target_id=target_id))
+            job["implications_moved"], job["implications_dropped"] = await repoint_implications(db, tag_id, target_id)
+            name = (await db.execute(select(Tag.name).where(Tag.id == tag_id))).scalar()
+            await db.execute(delete(Tag).where(Tag.id == tag_id))
+            on_commit(db, lambda: tag_index.remove_tag(tag_id))
+            if name is not None:
+                on_commit(db, lambda: tag_name_index.remove(name))
+            on_commit(db, tag_graph.load)
+
+        await write_coordinator.submit(merge)
+
+
+tag_jobs = TagJobQueue()
@@ -0,0 +1,114 @@
+"""In-memory tag name index for wildcard search terms."""
+import bisect
+import logging
+import re
+
+from sqlalchemy import select
+
+from ..database import read_session
+from ..models import Tag
+from .cache import tag_graph_generation
+
+logger = logging.getLogger(__name__)
+
+
+def trigrams(text: str) -> set[str]:
+    """All 3-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TagNameIndex:
+    """
+    Sorted array of tag names for prefix wildcards (`artist_*`) plus a
+    trigram index for suffix and infix wildcards (`*_(cosplay)`), so a
+    wildcard term costs an index probe instead of a scan of the tags table.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._names: list[str] = []
+        self._trigrams: dict[str, set[str]] = {}
+
+    async def build(self):
+        """Load every tag name from the database."""
+        async with read_session() as session:
+            result = await session.execute(select(Tag.name))
+            names = sorted(result.scalars().all())
+
+        index: dict[str, set[str]] = {}
+        for name in names:
+            for gram in trigrams(name):
+                index.setdefault(gram, set()).add(name)
+
+        self._names = names
+        self._trigrams = index
+        self.ready = True
+        tag_graph_generation.bump()
+        logger.info(f"Tag name index built: {len(names)} names")
+
+    def add(self, name: str):
+        """Register a new tag name."""
+        # Cached plans may have resolved this name as an unknown tag
+        tag_graph_generation.bump()
+        if not self.ready:
+            return
+        position = bisect.bisect_left(self._names, name)
+        if position < len(self._names) and self._names[position] == name:
+            return
+        self._names.insert(position, name)
+        for gram in trigrams(name):
+            self._trigrams.setdefault(gram, set()).add(name)
+
+    def remove(self, name: str):
+        """Forget a deleted or renamed tag name."""
+        tag_graph_generation.bump()
+        if not self.ready:
+            return
+        position = bisect.bisect_left(self._names, name)
+        if position < len(self._names) and self._names[position] == name:
+            del self._names[position]
+        for gram in trigrams(name):
+            names = self._trigrams.get(gram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self._trigrams[gram]
+
+    def expand(self, pattern: str, limit: int) -> list[str]:
+        """Tag names matching a `*` wildcard pattern, in name order, at most `limit`."""
+        matcher = re.compile(".*".join(re.escape(part) for part in pattern.split("*")))
+        fragments = [part for part in pattern.split("*") if part]
+        matches = []
+
+        if not pattern.startswith("*"):
+            # Prefix probe: walk the sorted range sharing the literal prefix
+            prefix = fragments[0]
+            position = bisect.bisect_left(self._names, prefix)
+            while position < len(self._names) and self._names[position].startswith(prefix):
+                name = self._names[position]
+                if matcher.fullmatch(name):
+                    matches.append(name)
+                    if len(matches) >= limit:
+                        break
+                position += 1
+            return matches
+
+        grams = set()
+        for fragment in fragments:
+            grams |= trigrams(fragment)
+        if grams:
+            postings = sorted((self._trigrams.get(gram, set()) for gram in grams), key=len)
+            candidates = sorted(set.intersection(*postings))
+        else:
+            # Fragments too short for trigrams; scan the in-memory names
+            candidates = self._names
+
+        for name in candidates:
+            if matcher.fullmatch(name):
+                matches.append(name)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+
+tag_name_index = TagNameIndex()
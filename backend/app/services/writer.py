@@ -0,0 +1,178 @@
+"""Single-writer commit queue with group commit."""
+import asyncio
+import inspect
+import logging
+from typing import Awaitable, Callable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import async_session
+from .cache import library_generation
+from .query_log import current_request
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteUnit = Callable[[AsyncSession], Awaitable[T]]
+
+
+def on_commit(session: AsyncSession, callback: Callable[[], object]):
+    """
+    Run `callback` (a function or coroutine function) once the unit's
+    transaction has committed, before its caller resumes. Use it for the
+    in-memory indexes that mirror committed rows.
+    """
+    session.info.setdefault("on_commit", []).append(callback)
+
+
+async def run_commit_callbacks(callbacks: list):
+    """
+    Run on_commit callbacks, then bump the write generation again: the commit
+    already bumped it, and anything cached while the indexes were still being
+    updated must not outlive that.
+    """
+    if not callbacks:
+        return
+    for callback in callbacks:
+        try:
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception("Post-commit callback failed")
+    library_generation.bump()
+
+
+class WriteCoordinator:
+    """
+    Runs write units of work one at a time through a single session.
+
+    A unit is an async function taking the session; it must not commit.
+    Units queued within a few milliseconds of each other share one
+    transaction, each inside its own savepoint, so a failing unit is rolled
+    back alone and only its caller sees the error. Callers are resumed once
+    the shared commit is durable, which makes ingest cost one fsync per
+    batch instead of one per request.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._busy = False
+        self.batches = 0
+        self.units = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def idle(self) -> bool:
+        """True when no write is queued or being committed."""
+        return not self.running or (self._queue.empty() and not self._busy)
+
+    def start(self):
+        """Start the writer task on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish queued work and stop the writer task."""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, unit: WriteUnit) -> T:
+        """Run a unit of work and return its result after the commit."""
+        if not self.running:
+            # No writer task (e.g. maintenance scripts): plain transaction
+            async with async_session() as session:
+                result = await unit(session)
+                await session.commit()
+                await run_commit_callbacks(session.info.pop("on_commit", []))
+                return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((unit, future, current_request.get()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        window = settings.write_batch_window_ms / 1000
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + window
+            while len(batch) < settings.write_batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self._busy = True
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                logger.exception("Write batch failed")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                self._busy = False
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit_batch(self, batch: list):
+        completed = []
+        callbacks = []
+        async with async_session() as session:
+            for unit, future, request in batch:
+                if future.done():
+                    continue  # Caller went away before its turn
+                # Attribute the unit's queries to the request that submitted it
+                token = current_request.set(request)
+                try:
+                    async with session.begin_nested():
+                        result = await unit(session)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                finally:
+                    current_request.reset(token)
+                    # Each unit starts from a fresh view of the rows it loads
+                    session.expire_all()
+                    # Callbacks of a rolled back unit are dropped with it
+                    unit_callbacks = session.info.pop("on_commit", [])
+                callbacks.extend(unit_callbacks)
+                completed.append((future, result))
+
+            if not completed:
+                await session.rollback()
+                return
+            await session.commit()
+
+        await run_commit_callbacks(callbacks)
+        self.batches += 1
+        self.units += len(completed)
+        for future, result in completed:
+            if not future.done():
+                future.set_result(result)
+
+
+write_coordinator = WriteCoordinator()
@@ -0,0 +1,68 @@
+"""
+Benchmark the per-request cost of the read-only session dependency.
+
+Runs the same read (one post by id) through the get_db and get_read_db
+dependencies and reports the mean latency of each. Only reads the
+database, so it is safe to run against a live library.
+
+Usage: python benchmark_read_sessions.py [iterations]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from app.database import get_db, get_read_db, init_db
+from app.models import Post
+from sqlalchemy import func, select
+
+
+async def run_dependency(dependency, post_id: int):
+    """Drive a session dependency the way FastAPI does for one request."""
+    generator = dependency()
+    session = await generator.__anext__()
+    await session.execute(select(Post).where(Post.id == post_id))
+    try:
+        await generator.__anext__()
+    except StopAsyncIteration:
+        pass
+
+
+async def measure(dependency, post_id: int, iterations: int) -> float:
+    """Mean milliseconds per request."""
+    # Warm up the pool and SQLite's page cache
+    for _ in range(20):
+        await run_dependency(dependency, post_id)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await run_dependency(dependency, post_id)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+async def benchmark(iterations: int):
+    await init_db()
+
+    async for session in get_read_db():
+        post_id = (await session.execute(select(func.max(Post.id)))).scalar() or 0
+
+    print(f"Running {iterations} requests per dependency...")
+    write_ms = await measure(get_db, post_id, iterations)
+    read_ms = await measure(get_read_db, post_id, iterations)
+
+    print("\n" + "="*50)
+    print(f"  get_db:      {write_ms:.3f} ms/request")
+    print(f"  get_read_db: {read_ms:.3f} ms/request")
+    print(f"  Saved:       {write_ms - read_ms:.3f} ms/request ({(1 - read_ms / write_ms) * 100:.0f}%)")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+        sys.exit(1)
@@ -40,12 +40,14 @@ export const api = {
     return request(`/posts${query ? `?${query}` : ''}`)
   },
 
-  async getPost(id) {
-    return request(`/posts/${id}`)
+  async getPost(id, params = {}) {
+    const query = new URLSearchParams(params).toString()
+    return request(`/posts/${id}${query ? `?${query}` : ''}`)
   },
 
-  async updatePost(id, data) {
-    return request(`/posts/${id}`, {
+  async updatePost(id, data, params = {}) {
+    const query = new URLSearchParams(params).toString()
+    return request(`/posts/${id}${query ? `?${query}` : ''}`, {
       method: 'PUT',
       body: JSON.stringify(data),
     })
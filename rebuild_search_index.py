@@ -0,0 +1,50 @@
+"""
+Script to rebuild the full-text search index (comments, notes, source, filename).
+Run this if text:/source:/filename: searches miss posts, e.g. after editing
+the database by hand or restoring an old backup.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from app.database import IS_SQLITE, async_session, init_db
+from app.services.fulltext import fulltext_index
+
+
+async def rebuild_search_index():
+    """Regenerate the full-text document of every post."""
+    # Creates the index table if this database predates it
+    await init_db()
+
+    if not IS_SQLITE:
+        print("PostgreSQL has no separate search index; text searches scan the tables directly.")
+        return
+
+    if not fulltext_index.available:
+        print("WARNING: this SQLite build does not include FTS5.")
+        print("Text searches will still work, but scan comments and notes directly.")
+        return
+
+    print("Rebuilding full-text search index...")
+
+    async with async_session() as session:
+        indexed = await fulltext_index.rebuild(session)
+        await session.commit()
+
+    print(f"Indexed {indexed} posts")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(rebuild_search_index())
+    except KeyboardInterrupt:
+        print("\nInterrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error during search index rebuild: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)